@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple, NamedTuple, TYPE_CHECKING
+
+from card_cache import CardCache, file_digest
+
+if TYPE_CHECKING:
+    from PIL.Image import Image as ImageType
+
+CACHE_FOLDER = "cache/artwork"
+# Image modes that survive a round trip through PNG unchanged
+PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+
+
+class FittedArtwork(NamedTuple):
+    picture: ImageType
+    mask: Optional[ImageType]
+    offset: Tuple[int, int]
+
+
+class ArtworkCache:
+    """
+    Keeps artwork already resized to the box it gets pasted into, along with its transparency mask, so each source
+    image is only decoded and resized once.
+    Entries live in memory, keyed by the source's path, mtime and size plus the target box, and the least recently used
+    ones are dropped once they take up more than max_bytes. If a folder is given, fitted artwork is also stored there,
+    keyed by a hash of the source's contents, so later runs can skip decoding the source entirely.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, folder: Optional[str] = CACHE_FOLDER):
+        self.max_bytes = max_bytes
+        self.disk = CardCache(folder) if folder else None
+        self._entries: OrderedDict[tuple, FittedArtwork] = OrderedDict()
+        self._total_bytes = 0
+        self.hits, self.misses = 0, 0
+
+    def get(self, filepath: str, width: int, height: int, stretch: bool = False) -> FittedArtwork:
+        """
+        Returns the image at filepath fitted inside width x height, keeping its aspect ratio, or resized to exactly
+        width x height if stretch is set. The returned images are shared, so don't modify them.
+        """
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime_ns, stat.st_size, width, height, stretch)
+        artwork = self._entries.get(key)
+        if artwork is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return artwork
+        self.misses += 1
+        disk_key = self._disk_key(filepath, width, height, stretch)
+        artwork = self._load(disk_key) if self.disk is not None else None
+        if artwork is None:
+            artwork = self._fit(filepath, width, height, stretch)
+            if self.disk is not None and artwork.picture.mode in PNG_MODES:
+                self.disk.put(disk_key, artwork.picture, {
+                    "offset": json.dumps(artwork.offset), "mask": json.dumps(artwork.mask is not None)
+                })
+        self._add(key, artwork)
+        return artwork
+
+    @staticmethod
+    def _fit(filepath: str, width: int, height: int, stretch: bool) -> FittedArtwork:
+        from PIL import Image
+        from pil_helpers import fit_image, has_transparency
+
+        picture = Image.open(filepath)
+        if stretch:
+            picture, offset = picture.resize((width, height)), (0, 0)
+        else:
+            picture, offset = fit_image(picture, width, height)
+        return FittedArtwork(picture, picture if has_transparency(picture) else None, offset)
+
+    @staticmethod
+    def _disk_key(filepath: str, width: int, height: int, stretch: bool) -> str:
+        return hashlib.sha256(f"{file_digest(filepath)}:{width}x{height}:{stretch}".encode()).hexdigest()
+
+    def _load(self, disk_key: str) -> Optional[FittedArtwork]:
+        picture = self.disk.get(disk_key)
+        if picture is None:
+            return None
+        try:
+            offset, use_mask = tuple(json.loads(picture.text["offset"])), json.loads(picture.text["mask"])
+        except (KeyError, ValueError):
+            return None
+        return FittedArtwork(picture, picture if use_mask else None, offset)
+
+    def _add(self, key: tuple, artwork: FittedArtwork):
+        self._entries[key] = artwork
+        self._total_bytes += _image_bytes(artwork.picture)
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= _image_bytes(evicted.picture)
+
+    def clear(self):
+        self._entries.clear()
+        self._total_bytes = 0
+
+
+def _image_bytes(im: ImageType) -> int:
+    return im.width * im.height * len(im.getbands())
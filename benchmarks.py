@@ -0,0 +1,282 @@
+"""
+Benchmarks for card and page generation, built from the real TOMLs in items/ and art in images/.
+
+    python benchmarks.py                                # Run everything and print the results
+    python benchmarks.py --save-baseline baseline.json  # Keep the results to compare later runs against
+    python benchmarks.py --compare baseline.json        # Exit with 1 if anything got slower than the threshold
+
+Micro-benchmarks run in this process after a warm-up call, so fonts and other in-memory caches are warm, which is the
+steady state of a real build. Text benchmarks are the exception: they clear the text layer and word width caches on
+every run, so they time the wrapping and drawing itself. On-disk caches are never used. Each full deck build runs in a
+fresh process, so its peak RSS is its own, and is repeated at least three times, so its median can be compared. Page
+encoding is measured for each page format and setting, along with the size of the file it makes.
+"""
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from multiprocessing import get_context
+from typing import Callable, Optional
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+DECK_SIZES = (10, 100, 1000)
+GRID = (3, 3)
+
+
+def get_peak_rss() -> Optional[int]:
+    """
+    @return int: Peak resident set size of this process in bytes, or None where the resource module isn't available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_item_paths() -> list[str]:
+    return sorted(glob.glob("items/**/*.toml", recursive=True))
+
+
+def build_deck(size: int) -> list[dict]:
+    """
+    A deck of `size` cards, cycling through every item in items/
+    """
+    paths = get_item_paths()
+    return [{"filepath": paths[i % len(paths)], "count": 1} for i in range(size)]
+
+
+def disable_disk_caches():
+    import main
+
+    main.set_disk_caches(False)
+
+
+def clear_text_caches():
+    """
+    Forgets drawn text layers and measured word widths, so text benchmarks time fitting, wrapping and drawing from
+    scratch. Loaded fonts are kept, like they are across the cards of a real build.
+    """
+    from pil_helpers import get_kerning, get_text_length, text_layers
+
+    text_layers.clear()
+    get_text_length.cache_clear()
+    get_kerning.cache_clear()
+
+
+def time_call(func: Callable, repeat: int) -> list[float]:
+    func()  # Warm up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_micro_benchmarks(repeat: int) -> dict[str, dict]:
+    import main
+    from artwork_cache import ArtworkCache
+    from layouts import DEFAULT_LAYOUT
+    from pil_helpers import TextBox, add_image, build_font, save_page
+    from qr_cache import QrCodeCache
+
+    disable_disk_caches()
+    toml_dicts = [main.open_toml(path) for path in get_item_paths()]
+    text_cards = [t for t in toml_dicts if not t.get("image_is_card")]
+    name = max((t["name"] for t in text_cards), key=len)
+    short = min((t["type"] for t in text_cards), key=len)
+    long = max((t["description"] for t in text_cards), key=len)
+    layout = main.get_layouts()[DEFAULT_LAYOUT]
+    box = layout.boxes["description"]
+    font = build_font(box.font_name, box.font_size)
+    template = layout.get_template()
+
+    benchmarks: dict[str, Callable] = {
+        # Clearing the text caches first measures wrapping and drawing the text, rather than looking it up
+        "add_text name": lambda: (clear_text_caches(), layout.boxes["name"].add_text(template.copy(), name)),
+        "add_text short": lambda: (clear_text_caches(), layout.boxes["subtitle"].add_text(template.copy(), short)),
+        "add_text long": lambda: (clear_text_caches(), box.add_text(template.copy(), long)),
+        "add_text short cached": lambda: layout.boxes["subtitle"].add_text(template.copy(), short),
+        "wrap_text long": lambda: (clear_text_caches(), TextBox.wrap_text(long, font, box.width)),
+        "shrink_font_until_text_fits long": lambda: (clear_text_caches(), box.shrink_font_until_text_fits(
+            long, box.font_name, box.font_size, box.width, box.height)),
+    }
+    # One picture of each format, decoded and resized every time, then the same through a warm ArtworkCache
+    pictures = {}
+    for path in sorted(os.listdir("images")):
+        pictures.setdefault(os.path.splitext(path)[1].lower(), path)
+    for extension, path in sorted(pictures.items()):
+        benchmarks[f"add_image {extension}"] = \
+            lambda path=path: add_image(template.copy(), path, *layout.picture_coords)
+    artwork = ArtworkCache(folder=None)
+    first_picture = next(iter(sorted(pictures.values())))
+    benchmarks["add_image cached"] = \
+        lambda: add_image(template.copy(), first_picture, *layout.picture_coords, cache=artwork)
+    qr_card = {"name": name}
+    benchmarks["add_qr_code generate"] = lambda: QrCodeCache(folder=None).get(main.get_qr_url(qr_card))
+    benchmarks["add_qr_code cached"] = lambda: main.add_qr_code(template.copy(), qr_card, layout)
+    page_cards = [template] * (GRID[0] * GRID[1])
+    page_path = os.path.join(tempfile.gettempdir(), "dnd_item_cards_benchmark_page.png")
+    benchmarks["save_page"] = lambda: save_page(page_cards, GRID, page_path, cut_line_width=0)
+
+    results = {}
+    with redirect_stdout(StringIO()):
+        for bench_name, func in benchmarks.items():
+            times = time_call(func, repeat)
+            results[bench_name] = {"median": statistics.median(times), "min": min(times)}
+    os.remove(page_path)
+    return results
+
+
+def run_encoding_benchmarks(repeat: int) -> dict[str, dict]:
+    """
+    Encodes a page of real, different cards with each format and setting, to compare time against file size
+    """
+    import main
+    from page_writer import get_save_options
+    from pil_helpers import compose_page
+
+    disable_disk_caches()
+    paths = get_item_paths()
+    with redirect_stdout(StringIO()):
+        cards = [main.build_card(path)[0] for path in paths[:GRID[0] * GRID[1]]]
+    page = compose_page(cards, GRID, cut_line_width=0)
+    settings = {
+        "png level 1": get_save_options("png", compress_level=1),
+        "png level 6": get_save_options("png", compress_level=6),
+        "png level 9": get_save_options("png", compress_level=9),
+        "jpeg quality 90": get_save_options("jpeg", quality=90),
+        "jpeg quality 75": get_save_options("jpeg", quality=75),
+        "webp quality 90": get_save_options("webp", quality=90),
+        "tiff deflate": get_save_options("tiff"),
+    }
+    results = {}
+    for name, options in settings.items():
+        buffer = BytesIO()
+
+        def encode():
+            buffer.seek(0)
+            buffer.truncate()
+            page.save(buffer, dpi=(300, 300), **options)
+
+        times = time_call(encode, repeat)
+        results[f"encode page {name}"] = {"median": statistics.median(times), "min": min(times),
+                                          "bytes": buffer.tell()}
+    return results
+
+
+def run_deck_benchmark(size: int) -> dict:
+    """
+    Runs in its own process. Builds a full deck with main.build_cards, pages and all, with no card cache.
+    """
+    import main
+
+    disable_disk_caches()
+    folder = f"benchmark_{size}"
+    with redirect_stdout(StringIO()):
+        start = time.perf_counter()
+        main.save_cards_to_pages(main.iter_cards(build_deck(size)), GRID, folder=folder)
+        seconds = time.perf_counter() - start
+    pages = len(os.listdir(f"output/{folder}"))
+    for filename in os.listdir(f"output/{folder}"):
+        os.remove(f"output/{folder}/{filename}")
+    os.rmdir(f"output/{folder}")
+    return {"seconds": seconds, "pages": pages, "peak_rss": get_peak_rss()}
+
+
+def run_deck_benchmarks(size: int, repeat: int) -> dict:
+    """
+    Builds the deck `repeat` times, each in a fresh process, and reports the median run, so a single slow run doesn't
+    look like a regression
+    """
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(run_deck_benchmark, size).result())
+    times = [run["seconds"] for run in runs]
+    median = statistics.median(times)
+    peak_rss = [run["peak_rss"] for run in runs if run["peak_rss"] is not None]
+    return {
+        "median": median,
+        "min": min(times),
+        "cards_per_second": size / median,
+        "pages_per_second": runs[0]["pages"] / median,
+        "peak_rss": max(peak_rss) if peak_rss else None,
+    }
+
+
+def run_benchmarks(sizes, repeat: int, deck_repeat: int = 3) -> dict[str, dict]:
+    results = run_micro_benchmarks(repeat)
+    results.update(run_encoding_benchmarks(repeat))
+    for size in sizes:
+        results[f"build_cards {size} cards"] = run_deck_benchmarks(size, deck_repeat)
+    return results
+
+
+def print_results(results: dict[str, dict], baseline: Optional[dict[str, dict]] = None):
+    print(f"{'Benchmark':<36}{'Median ms':>12}{'Min ms':>12}{'Cards/s':>10}{'Pages/s':>10}{'Peak RSS MB':>13}"
+          f"{'Size KB':>10}{'vs baseline':>13}")
+    for name, result in results.items():
+        line = f"{name:<36}{result['median'] * 1000:>12.2f}{result['min'] * 1000:>12.2f}"
+        line += f"{result['cards_per_second']:>10.1f}" if "cards_per_second" in result else f"{'':>10}"
+        line += f"{result['pages_per_second']:>10.2f}" if "pages_per_second" in result else f"{'':>10}"
+        line += f"{result['peak_rss'] / 1024 / 1024:>13.1f}" if result.get("peak_rss") else f"{'':>13}"
+        line += f"{result['bytes'] / 1024:>10.0f}" if "bytes" in result else f"{'':>10}"
+        if baseline and name in baseline:
+            line += f"{result['median'] / baseline[name]['median'] - 1:>+13.1%}"
+        print(line)
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    return [
+        name for name, result in results.items()
+        if name in baseline and result["median"] > baseline[name]["median"] * (1 + threshold)
+    ]
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Benchmarks card and page generation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DECK_SIZES, help="Deck sizes to build")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of timed runs of each micro-benchmark")
+    parser.add_argument("--deck-repeat", type=int, default=3,
+                        help="Number of times each deck is built, to compare the median of (default 3, at least 3)")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare the results against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="How much slower than the baseline counts as a regression (default 0.1, i.e. 10%%)")
+    args = parser.parse_args(argv)
+    if args.deck_repeat < 3:
+        parser.error("--deck-repeat has to be at least 3")
+
+    results = run_benchmarks(args.sizes, args.repeat, args.deck_repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nSlower than the baseline by more than {args.threshold:.0%}:")
+            for name in regressions:
+                print(f"  {name}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
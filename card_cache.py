@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Optional, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL.Image import Image as ImageType
+
+CACHE_FOLDER = "cache/cards"
+# Bump this whenever a change to the rendering code would change the output for the same inputs
+RENDER_VERSION = 1
+
+_file_digests: dict[tuple[str, int, int], str] = {}
+
+
+def file_digest(filepath: str) -> str:
+    """
+    Returns the sha256 of a file's contents. Digests are remembered by path, mtime and size, so each file only gets
+    read once per run unless it changes.
+    """
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return "missing"
+    key = (filepath, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        h = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        _file_digests[key] = h.hexdigest()
+    return _file_digests[key]
+
+
+def card_key(toml_dict: dict[str, Any], dependencies: Iterable[str], layout: str) -> str:
+    """
+    Builds the content address of a card from everything that goes into rendering it: the parsed TOML, the contents of
+    every file it depends on (artwork, template, fonts), and a fingerprint of the layout constants.
+    """
+    h = hashlib.sha256()
+    h.update(f"v{RENDER_VERSION}\n".encode())
+    h.update(json.dumps(toml_dict, sort_keys=True, default=str).encode())
+    for filepath in sorted(set(dependencies)):
+        h.update(f"\n{filepath}:{file_digest(filepath)}".encode())
+    h.update(f"\n{layout}".encode())
+    return h.hexdigest()
+
+
+class CardCache:
+    """
+    Persistent cache of rendered cards (or any other images), stored as lossless PNGs named after their key. An entry's
+    mtime is refreshed every time it's used, so pruning can evict the least recently used entries first.
+    """
+
+    def __init__(self, folder: str = CACHE_FOLDER):
+        self.folder = folder
+        self.hits, self.misses = 0, 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key + ".png")
+
+    def get(self, key: str) -> Optional[ImageType]:
+        # Pillow is only imported once it's needed, so inspecting and pruning the cache stays quick to start
+        from PIL import Image
+
+        filepath = self.path(key)
+        try:
+            im = Image.open(filepath)
+            im.load()
+        except (FileNotFoundError, OSError):
+            self.misses += 1
+            return None
+        os.utime(filepath)
+        self.hits += 1
+        return im
+
+    def put(self, key: str, im: ImageType, text: Optional[dict[str, str]] = None):
+        """
+        Stores the image under key. Any text is saved in the PNG alongside it, and comes back in the image's .text
+        """
+        from PIL.PngImagePlugin import PngInfo
+
+        filepath = self.path(key)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        pnginfo = None
+        if text:
+            pnginfo = PngInfo()
+            for k, v in text.items():
+                pnginfo.add_text(k, v)
+        # Write to a temp file first, so an interrupted run never leaves a truncated entry behind
+        temp_path = f"{filepath}.{os.getpid()}.tmp"
+        im.save(temp_path, format="PNG", compress_level=1, pnginfo=pnginfo)
+        os.replace(temp_path, filepath)
+
+    def entries(self) -> list[tuple[str, int, float]]:
+        """
+        @return list[(str, int, float)]: Path, size in bytes, and last used time of every entry, oldest first.
+        """
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if not filename.endswith(".png"):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                stat = os.stat(filepath)
+                entries.append((filepath, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def stats(self) -> dict[str, Any]:
+        entries = self.entries()
+        return {
+            "folder": self.folder,
+            "entries": len(entries),
+            "total_bytes": sum(e[1] for e in entries),
+            "oldest": time.ctime(entries[0][2]) if entries else None,
+            "newest": time.ctime(entries[-1][2]) if entries else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def prune(self, max_bytes: Optional[int] = None, max_age_days: Optional[float] = None) -> tuple[int, int]:
+        """
+        Deletes entries that haven't been used in max_age_days, then the least recently used entries until the cache
+        fits in max_bytes.
+
+        @return (int, int): Number of entries removed, and the number of bytes freed.
+        """
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+        removed, freed = 0, 0
+        for filepath, size, mtime in entries:
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = max_bytes is not None and total > max_bytes
+            if not too_old and not too_big:
+                continue
+            os.remove(filepath)
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def clear(self) -> tuple[int, int]:
+        return self.prune(max_bytes=0)
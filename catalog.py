@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Optional, NamedTuple
+
+CATALOG_PATH = "cache/catalog.sqlite"
+ITEMS_FOLDER = "items"
+# Bump this whenever the schema changes, and the catalog will be rebuilt from scratch
+SCHEMA_VERSION = 2
+
+
+class CatalogItem(NamedTuple):
+    path: str
+    name: Optional[str]
+    type: Optional[str]
+    rarity_folder: str
+    requires_attunement: bool
+    image_path: Optional[str]
+
+
+class Catalog:
+    """
+    A persistent index of every item TOML, stored in SQLite. Each item's parsed fields are kept alongside its mtime,
+    size and hash, so refreshing only has to stat the tree and re-parse the files that changed, and queries don't have
+    to touch the tree at all. Files that can't be parsed are kept with their error instead, and left out of queries.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH, items_folder: str = ITEMS_FOLDER):
+        self.items_folder = items_folder
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS items")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                path TEXT PRIMARY KEY,
+                name TEXT,
+                type TEXT,
+                rarity_folder TEXT,
+                requires_attunement INTEGER,
+                image_path TEXT,
+                mtime_ns INTEGER,
+                size INTEGER,
+                sha256 TEXT,
+                toml TEXT,
+                error TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_rarity_folder ON items (rarity_folder)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self) -> tuple[int, int]:
+        """
+        Brings the catalog up to date with the items folder. Only files whose mtime or size changed get read, and ones
+        that can't be parsed are skipped with a warning, so one broken item doesn't keep the rest from being listed.
+
+        @return (int, int): Number of items added or updated, and number of items removed.
+        """
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                 self.db.execute("SELECT path, mtime_ns, size FROM items")}
+        errors = self.get_errors()
+        seen, updated = set(), 0
+        for dirpath, dirnames, filenames in os.walk(self.items_folder):
+            for filename in filenames:
+                if not filename.endswith(".toml"):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                seen.add(filepath)
+                stat = os.stat(filepath)
+                if known.get(filepath) != (stat.st_mtime_ns, stat.st_size):
+                    updated += 1
+                    try:
+                        self._update(filepath, stat)
+                    except ValueError as e:
+                        errors[filepath] = str(e)
+                    else:
+                        errors.pop(filepath, None)
+        for filepath, error in errors.items():
+            if filepath in seen:
+                print(f"Skipping {filepath}, since it can't be parsed: {error}")
+        removed = [(path,) for path in known if path not in seen and path.startswith(self.items_folder)]
+        self.db.executemany("DELETE FROM items WHERE path = ?", removed)
+        self.db.commit()
+        return updated, len(removed)
+
+    def get_toml(self, filepath: str) -> dict[str, Any]:
+        """
+        Returns the parsed TOML for filepath from the catalog, only reading the file if it changed since it was indexed.
+        Files outside of the items folder get indexed the first time they're asked for. A file that can't be parsed is
+        read again, so its own error is raised here.
+        """
+        stat = os.stat(filepath)
+        row = self.db.execute("SELECT mtime_ns, size, toml FROM items WHERE path = ? AND error IS NULL",
+                              (filepath,)).fetchone()
+        if row is not None and (row[0], row[1]) == (stat.st_mtime_ns, stat.st_size):
+            return json.loads(row[2])
+        try:
+            return self._update(filepath, stat)
+        finally:
+            self.db.commit()
+
+    def get_errors(self) -> dict[str, str]:
+        """
+        The items that couldn't be parsed the last time they were read, left out of queries.
+
+        @return (dict[str, str]): The error for each of their paths.
+        """
+        return dict(self.db.execute("SELECT path, error FROM items WHERE error IS NOT NULL ORDER BY path"))
+
+    def query(self, rarity: Optional[str] = None, item_type: Optional[str] = None,
+              requires_attunement: Optional[bool] = None, name: Optional[str] = None) -> list[CatalogItem]:
+        """
+        Finds items by rarity folder (e.g. "common", "key_items"), and by type and name patterns, where * matches
+        anything and matching ignores case. A type pattern without a * matches anywhere in the type.
+        """
+        clauses, params = ["error IS NULL"], []
+        if rarity is not None:
+            clauses.append("rarity_folder = ?")
+            params.append(rarity)
+        if item_type is not None:
+            clauses.append("type LIKE ?")
+            params.append(item_type.replace("*", "%") if "*" in item_type else f"%{item_type}%")
+        if requires_attunement is not None:
+            clauses.append("requires_attunement = ?")
+            params.append(int(requires_attunement))
+        if name is not None:
+            clauses.append("name LIKE ?")
+            params.append(name.replace("*", "%"))
+        rows = self.db.execute(f"SELECT path, name, type, rarity_folder, requires_attunement, image_path FROM items "
+                               f"WHERE {' AND '.join(clauses)} ORDER BY path", params)
+        return [CatalogItem(path, name, item_type, rarity_folder, bool(attunement), image_path)
+                for path, name, item_type, rarity_folder, attunement, image_path in rows]
+
+    def _update(self, filepath: str, stat: os.stat_result) -> dict[str, Any]:
+        # Only needed when an item changed, so listing an up to date catalog doesn't pay for importing it
+        import tomllib
+
+        with open(filepath, "rb") as f:
+            contents = f.read()
+        sha256 = hashlib.sha256(contents).hexdigest()
+        row = self.db.execute("SELECT sha256, toml FROM items WHERE path = ? AND error IS NULL", (filepath,)).fetchone()
+        if row is not None and row[0] == sha256:
+            # Only the mtime changed, so there's no need to parse it again
+            self.db.execute("UPDATE items SET mtime_ns = ?, size = ? WHERE path = ?",
+                            (stat.st_mtime_ns, stat.st_size, filepath))
+            return json.loads(row[1])
+        rarity_folder = os.path.basename(os.path.dirname(filepath))
+        try:
+            # TOMLDecodeError and UnicodeDecodeError are both ValueErrors
+            toml_dict = tomllib.loads(contents.decode())
+        except ValueError as e:
+            # Kept with its error, so it isn't read again until it changes, and queries can leave it out
+            self.db.execute("INSERT OR REPLACE INTO items VALUES (?, NULL, NULL, ?, 0, NULL, ?, ?, ?, NULL, ?)",
+                            (filepath, rarity_folder, stat.st_mtime_ns, stat.st_size, sha256, str(e)))
+            raise
+        self.db.execute(
+            "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+            (filepath, toml_dict.get("name"), toml_dict.get("type"), rarity_folder,
+             int(bool(toml_dict.get("requires_attunement"))), toml_dict.get("image_path"), stat.st_mtime_ns,
+             stat.st_size, sha256, json.dumps(toml_dict, default=str))
+        )
+        return toml_dict
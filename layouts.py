@@ -0,0 +1,131 @@
+import os
+import tomllib
+from typing import Any, Optional
+
+from PIL.Image import Image
+
+from enums import HAlign, VAlign
+from pil_helpers import TextBox, build_font, open_image
+from qr_cache import QrCodeCache
+
+LAYOUTS_FOLDER = "layouts"
+DEFAULT_LAYOUT = "default"
+# The text boxes every layout needs, one for each part of the card that gets text
+TEXT_BOXES = ("name", "subtitle", "description")
+
+
+class Layout:
+    """
+    Where everything goes on a card, as defined in a layout TOML. Everything that doesn't depend on the card is worked
+    out once, when the layout is loaded: text boxes are built and their anchors resolved, their fonts are loaded, and
+    the template is decoded, so rendering a card only has to copy the template and draw on it.
+    A scale below 1 makes a layout for proofs: the template, boxes, picture, QR code and fonts are all scaled down
+    together, but text is still fitted and wrapped at print size, so a proof breaks lines exactly like the print.
+    """
+
+    def __init__(self, name: str, settings: dict[str, Any], scale: float = 1):
+        self.name, self.scale = name, scale
+        self.template_path = settings.get("template", "template.jpg")
+        self.rarities = settings.get("rarities", [])
+        self.types = [item_type.lower() for item_type in settings.get("types", [])]
+        missing = [box for box in (*TEXT_BOXES, "picture") if box not in settings]
+        if missing:
+            raise ValueError(f"Layout {name} is missing {', '.join(missing)}")
+        self.boxes = {box: build_text_box(settings[box], scale) for box in TEXT_BOXES}
+        self.picture_coords = tuple(round(v * scale) for v in settings["picture"]["box"])
+        qr = settings.get("qr", {})
+        self.qr_settings = {"version": qr.get("version", 1), "box_size": qr.get("box_size", 5),
+                            "border": qr.get("border", 2)}
+        self.qr_coords = tuple(round(v * scale) for v in qr.get("offset", (30, 580)))
+        self.qr_codes = QrCodeCache(**self.qr_settings, scale=scale)
+        self.fingerprint = repr(([vars(box) for box in self.boxes.values()], self.picture_coords, self.qr_settings,
+                                 self.qr_coords, scale))
+        self.dependencies = [self.template_path] + list(dict.fromkeys(box.font_name for box in self.boxes.values()))
+        for box in self.boxes.values():
+            build_font(box.font_name, box.font_size)
+            if scale != 1:
+                build_font(box.font_name, max(1, int(box.font_size * scale)))
+        self._template_key: Optional[tuple] = None
+        self._template: Optional[Image] = None
+        self.load_template()
+
+    def load_template(self) -> Image:
+        """
+        Returns the decoded template, which is only decoded again when the file changes
+        """
+        stat = os.stat(self.template_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key != self._template_key:
+            template = open_image(self.template_path)
+            template.load()
+            if self.scale != 1:
+                template = template.resize((round(template.width * self.scale), round(template.height * self.scale)))
+            self._template_key, self._template = key, template
+        return self._template
+
+    def get_template(self) -> Image:
+        """
+        Returns a fresh copy of the template to draw a card on
+        """
+        return self.load_template().copy()
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.load_template().size
+
+    def matches(self, toml_path: str, toml_dict: dict[str, Any]) -> bool:
+        if not self.rarities and not self.types:
+            return False
+        if self.rarities and os.path.basename(os.path.dirname(toml_path)) not in self.rarities:
+            return False
+        item_type = (toml_dict.get("type") or "").lower()
+        return not self.types or any(pattern in item_type for pattern in self.types)
+
+
+def build_text_box(settings: dict[str, Any], scale: float = 1) -> TextBox:
+    x, y, w, h = settings["box"]
+    kwargs = {}
+    if "font" in settings:
+        kwargs["font_name"] = settings["font"]
+    if "font_size" in settings:
+        kwargs["font_size"] = settings["font_size"]
+    return TextBox(x, y, w, h,
+                   halign=HAlign[settings.get("halign", "center").upper()],
+                   valign=VAlign[settings.get("valign", "center").upper()],
+                   rotate=settings.get("rotate", 0),
+                   use_height_for_text_wrap=settings.get("use_height_for_text_wrap", False),
+                   shrink_font_size_to_fit=settings.get("shrink_to_fit", False),
+                   scale=scale,
+                   **kwargs)
+
+
+def load_layouts(folder: str = LAYOUTS_FOLDER, scale: float = 1) -> dict[str, Layout]:
+    """
+    Loads and compiles every layout in the folder, keyed by file name without the extension, at the given scale
+    """
+    layouts = {}
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith(".toml"):
+            continue
+        with open(os.path.join(folder, filename), "rb") as f:
+            settings = tomllib.load(f)
+        name = os.path.splitext(filename)[0]
+        layouts[name] = Layout(name, settings, scale)
+    if DEFAULT_LAYOUT not in layouts:
+        raise ValueError(f"{folder} needs a {DEFAULT_LAYOUT}.toml")
+    return layouts
+
+
+def choose_layout(layouts: dict[str, Layout], toml_path: str, toml_dict: dict[str, Any]) -> Layout:
+    """
+    The layout the card names, or else the first one (by file name) whose rarities and types match it, or else the
+    default layout
+    """
+    if "layout" in toml_dict:
+        if toml_dict["layout"] not in layouts:
+            raise ValueError(f"{toml_path} uses layout {toml_dict['layout']}, which isn't in {LAYOUTS_FOLDER}")
+        return layouts[toml_dict["layout"]]
+    for layout in layouts.values():
+        if layout.matches(toml_path, toml_dict):
+            return layout
+    return layouts[DEFAULT_LAYOUT]
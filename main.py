@@ -1,19 +1,33 @@
+from __future__ import annotations
+
 import os
-import tomllib
+import sys
+from argparse import ArgumentParser, BooleanOptionalAction
+from collections import deque
 from csv import DictWriter, DictReader
-from typing import Any, List, Tuple, Optional, TypedDict
+from itertools import islice
+from typing import Any, List, Tuple, Optional, TypedDict, Iterator, Iterable, NamedTuple, TYPE_CHECKING
 
-import qrcode
-from PIL.Image import Image
+from card_cache import CardCache, card_key
+from page_writer import PageWriter, PAGE_FORMATS, MAX_PENDING_PAGES
+from pdf_writer import PdfWriter, COMPRESSIONS
+from profiling import profiler
 
-from enums import VAlign
-from pil_helpers import open_image, add_image, TextBox, save_page
+# Pillow, qrcode, tomllib and the rest of the rendering code are imported where they're first needed, so commands that
+# don't render anything, like catalog and cache, start quickly. tests/test_startup.py holds them to that, and
+# python -X importtime main.py catalog shows where the time goes.
+if TYPE_CHECKING:
+    from PIL.Image import Image
+    from artwork_cache import ArtworkCache
+    from catalog import Catalog, CatalogItem
+    from layouts import Layout
 
-name_box = TextBox(50, 30, 650, 110, font_size=72, font_name="fonts/Enchanted Land DEMO.otf",
-                   shrink_font_size_to_fit=True)
-subtitle_box = TextBox(50, 110, 650, 30)
-description_box = TextBox(40, 670, 670, 320, valign=VAlign.TOP, shrink_font_size_to_fit=True)
-picture_coords = (40, 190, 670, 450)
+_artwork: Optional[ArtworkCache] = None
+# Compiled layouts, by render scale
+_layouts: dict[float, dict[str, Layout]] = {}
+_catalog: Optional[Catalog] = None
+# Whether fitted artwork and QR codes are also kept on disk, in cache/, for later runs and worker processes
+_disk_caches = True
 
 
 class CardListRow(TypedDict):
@@ -21,25 +35,107 @@ class CardListRow(TypedDict):
     count: int
 
 
+class RenderedCard(NamedTuple):
+    # Every copy of a card in a deck comes from the same file, so within a build, the file stands for the card
+    filepath: str
+    image: Image
+
+
 def open_toml(filepath: str) -> dict[str, Any]:
-    with open(filepath, "rb") as f:
+    import tomllib
+
+    with profiler.stage("toml load", filepath), open(filepath, "rb") as f:
         return tomllib.load(f)
 
 
-def build_card_list():
+def get_catalog() -> Catalog:
+    """
+    The item catalog for this process, opened and brought up to date the first time it's needed
+    """
+    global _catalog
+    if _catalog is None:
+        from catalog import Catalog
+
+        catalog = Catalog()
+        # Only kept once it's up to date, so a refresh that fails doesn't leave a half-refreshed catalog behind
+        catalog.refresh()
+        _catalog = catalog
+    return _catalog
+
+
+def get_layouts(reload: bool = False, scale: float = 1) -> dict[str, Layout]:
+    """
+    Every card layout at the given scale, loaded and compiled the first time they're needed
+    """
+    if reload:
+        _layouts.clear()
+    if scale not in _layouts:
+        from layouts import load_layouts
+
+        _layouts[scale] = load_layouts(scale=scale)
+        if not _disk_caches:
+            for layout in _layouts[scale].values():
+                layout.qr_codes.disk = None
+    return _layouts[scale]
+
+
+def get_layout(toml_path: str, toml_dict: dict[str, Any], scale: float = 1) -> Layout:
+    from layouts import choose_layout
+
+    return choose_layout(get_layouts(scale=scale), toml_path, toml_dict)
+
+
+def get_artwork() -> ArtworkCache:
+    """
+    The fitted artwork cache for this process
+    """
+    global _artwork
+    if _artwork is None:
+        from artwork_cache import ArtworkCache, CACHE_FOLDER
+
+        _artwork = ArtworkCache(folder=CACHE_FOLDER if _disk_caches else None)
+    return _artwork
+
+
+def set_disk_caches(enabled: bool):
+    """
+    Turns the on-disk layers of the artwork and QR code caches on or off, for this process and the worker processes it
+    starts. Their in-memory layers are always used.
+    """
+    from qr_cache import CACHE_FOLDER as QR_CACHE_FOLDER
+
+    global _disk_caches, _artwork
+    if enabled != _disk_caches:
+        _disk_caches = enabled
+        # Made again the next time it's needed, with or without its folder
+        _artwork = None
+        for layouts in _layouts.values():
+            for layout in layouts.values():
+                layout.qr_codes.disk = CardCache(QR_CACHE_FOLDER) if enabled else None
+
+
+def load_card_toml(filepath: str) -> dict[str, Any]:
+    """
+    Like open_toml, but served from the item catalog, so files that haven't changed aren't parsed again
+    """
+    with profiler.stage("toml load", filepath):
+        return get_catalog().get_toml(filepath)
+
+
+def build_card_list(items: Optional[list[CatalogItem]] = None):
+    """
+    Writes card_list.csv with one of each item, or of each of the given items
+    """
+    if items is None:
+        items = get_catalog().query()
     with open("card_list.csv", "w", newline='') as f:
         writer = DictWriter(f, ["Name", "Path", "Count"])
         writer.writeheader()
-        for dirpath, dirnames, filenames in os.walk("items"):
-            for filename in filenames:
-                if not filename.endswith(".toml"):
-                    continue
-                filepath = os.path.join(dirpath, filename)
-                toml_dict = open_toml(filepath)
-                try:
-                    writer.writerow({"Name": toml_dict["name"], "Path": filepath, "Count": 1})
-                except KeyError:
-                    print("jfklskjds")
+        for item in items:
+            if item.name is None:
+                print(f"Skipping {item.path}, since it has no name")
+                continue
+            writer.writerow({"Name": item.name, "Path": item.path, "Count": 1})
 
 
 def get_card_list() -> Optional[list[CardListRow]]:
@@ -56,94 +152,441 @@ def get_card_list() -> Optional[list[CardListRow]]:
     return card_list_rows
 
 
+def get_paths_to_validate(paths: list[str], all_items: bool) -> list[str]:
+    """
+    The item TOMLs the validate command checks: the given ones, or the cards in card_list.csv, or every item with
+    all_items or without a card list. Unlike rendering, it never writes card_list.csv. Items that can't be parsed are
+    included, so they're reported as cards with errors.
+    """
+    if paths:
+        return paths
+    if not all_items and os.path.isfile("card_list.csv"):
+        return list(dict.fromkeys(row["filepath"] for row in get_card_list()))
+    if not all_items:
+        print("No card_list.csv, so checking every item")
+    catalog = get_catalog()
+    return sorted([item.path for item in catalog.query()] + list(catalog.get_errors()))
+
+
 def check_cards(toml_dicts: dict[str, dict]):
     print("About to create image for the following cards:")
     for path in toml_dicts:
         print(path)
 
 
-def build_cards(card_list_rows: list[CardListRow]):
-    cards = []
-    for row in card_list_rows:
-        filepath = row["filepath"]
-        cards += build_card(filepath, open_toml(filepath), row["count"])
-    save_cards_to_pages(cards)
+def build_cards(card_list_rows: list[CardListRow], cache: Optional[CardCache] = None, jobs: int = 1,
+                prefetch: Optional[int] = None, output_format: str = "png", pdf_compression: str = "jpeg",
+                compress_level: int = 6, quality: int = 90, encode_threads: int = 0, scale: float = 1,
+                pending_pages: int = MAX_PENDING_PAGES):
+    """
+    Renders the deck and saves its pages. A scale below 1 renders a proof instead, with every card and page scaled down
+    by that much, into output/proofs rather than over the print pages.
+    """
+    # Compile the layouts before any worker processes start, so they all inherit them instead of loading their own
+    get_layouts(scale=scale)
+    pregenerate_qr_codes(card_list_rows, scale)
+    cards = iter_cards(card_list_rows, cache, jobs, prefetch, scale)
+    folder, dpi = ("pages", 300) if scale == 1 else ("proofs", round(300 * scale))
+    if output_format == "pdf":
+        save_cards_to_pdf(cards, filename=folder, compression=pdf_compression, quality=quality, dpi=dpi)
+    else:
+        save_cards_to_pages(cards, folder=folder, image_format=output_format, compress_level=compress_level,
+                            quality=quality, threads=encode_threads, dpi=dpi, max_pending=pending_pages)
+    if cache is not None:
+        print(f"Card cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def iter_cards(card_list_rows: list[CardListRow], cache: Optional[CardCache] = None, jobs: int = 1,
+               prefetch: Optional[int] = None, scale: float = 1) -> Iterator[RenderedCard]:
+    """
+    Lazily renders the cards in card_list_rows, yielding each one as many times as its count, in order. Cards are only
+    rendered when the page they go on is being filled, so a deck never has to be held in memory all at once.
+    """
+    if jobs == 1:
+        for row in card_list_rows:
+            filepath = row["filepath"]
+            card = RenderedCard(filepath, build_card(filepath, load_card_toml(filepath), cache=cache, scale=scale)[0])
+            for _ in range(row["count"]):
+                yield card
+    else:
+        yield from iter_cards_in_parallel(card_list_rows, cache, jobs, prefetch, scale)
+
+
+def iter_cards_in_parallel(card_list_rows: list[CardListRow], cache: Optional[CardCache] = None, jobs: int = 0,
+                           prefetch: Optional[int] = None, scale: float = 1) -> Iterator[RenderedCard]:
+    """
+    Renders each unique card in card_list_rows on a pool of worker processes, and yields them in the same order and
+    counts as card_list_rows, so the pages come out exactly as they would in serial mode.
+    At most `prefetch` cards (twice the number of workers by default) are rendered ahead of the one being yielded, and
+    a card is let go of as soon as its last row has been yielded. jobs <= 0 uses every core.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from PIL import Image as PILImage
+
+    filepaths = [row["filepath"] for row in card_list_rows]
+    last_row = {filepath: i for i, filepath in enumerate(filepaths)}
+    to_submit = iter(dict.fromkeys(filepaths))
+    workers = jobs if jobs > 0 else os.cpu_count()
+    prefetch = max(prefetch, 1) if prefetch is not None else workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_disk_caches, initargs=(_disk_caches,)) as executor:
+        pending = deque()
+        rendered = {}
+        for i, row in enumerate(card_list_rows):
+            filepath = row["filepath"]
+            while filepath not in rendered:
+                # Keep the pool busy up to the prefetch window, then wait on the oldest card
+                for next_filepath in islice(to_submit, prefetch - len(pending)):
+                    pending.append((next_filepath, executor.submit(render_card_raster, next_filepath,
+                                                                   load_card_toml(next_filepath), cache,
+                                                                   profiler.enabled, scale)))
+                done_filepath, future = pending.popleft()
+                mode, size, data, hits, misses, records = future.result()
+                profiler.records += records
+                rendered[done_filepath] = PILImage.frombytes(mode, size, data)
+                if cache is not None:
+                    cache.hits += hits
+                    cache.misses += misses
+            card = RenderedCard(filepath, rendered[filepath] if last_row[filepath] > i else rendered.pop(filepath))
+            for _ in range(row["count"]):
+                yield card
+
+
+def render_card_raster(toml_path: str, toml_dict: dict[str, Any], cache: Optional[CardCache] = None,
+                       profile: bool = False, scale: float = 1
+                       ) -> Tuple[str, Tuple[int, int], bytes, int, int, list[dict]]:
+    """
+    Worker process entry point for iter_cards_in_parallel. Takes only picklable arguments, and hands the card back as
+    raw pixel data along with the worker's card cache hits and misses, and its profiling records.
+    """
+    if profile:
+        profiler.enable()
+        # Forked workers start out with a copy of the main process's records, which it already has
+        profiler.pop_records()
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    im = build_card(toml_path, toml_dict, cache=cache, scale=scale)[0]
+    if im.mode in ("P", "PA"):
+        # A palette doesn't survive tobytes(). Pasting onto the page converts to RGB anyway, so do that here.
+        im = im.convert("RGB")
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return im.mode, im.size, im.tobytes(), hits, misses, profiler.pop_records()
 
 
-def build_card(toml_path: str, toml_dict: dict = None, count: int = 1) -> Optional[List[Image]]:
+def build_card(toml_path: str, toml_dict: dict = None, count: int = 1, cache: Optional[CardCache] = None,
+               scale: float = 1) -> Optional[List[Image]]:
+    """
+    Renders the card once and returns a list holding `count` references to that same image. The copies are identical,
+    so there's no need to run the template, text, image and QR code steps again for each one. Treat the returned
+    images as read-only, since changing one of them changes all of them.
+    If a cache is given, a card whose inputs haven't changed is loaded from it instead of being rendered again.
+    With a scale below 1, the card is rendered that much smaller, as a proof that wraps its text exactly like the print.
+    """
     print(toml_path)
-    if toml_dict is None:
-        toml_dict = open_toml(toml_path)
-    image_list = []
-    for _ in range(count):
+    with profiler.card(toml_path):
+        if toml_dict is None:
+            toml_dict = open_toml(toml_path)
+        layout = get_layout(toml_path, toml_dict, scale)
         if toml_dict.get("image_is_card"):
-            im = open_image("images/" + toml_dict["image_path"])
-        else:
-            im = get_template()
-            add_text(im, toml_dict)
+            with profiler.stage("image"):
+                picture = get_artwork().get("images/" + toml_dict["image_path"], *layout.size, stretch=True).picture
+                return [picture] * count
+        key, im = None, None
+        if cache is not None:
+            with profiler.stage("card cache load"):
+                key = get_card_key(toml_dict, layout)
+                im = cache.get(key)
+        if im is None:
+            with profiler.stage("template open"):
+                im = layout.get_template()
+            add_text(im, toml_dict, layout)
             if "url" in toml_dict:
-                add_qr_code(im, toml_dict)
-        image_list.append(im)
-    return image_list
+                with profiler.stage("qr code"):
+                    add_qr_code(im, toml_dict, layout)
+            if cache is not None:
+                with profiler.stage("card cache save"):
+                    cache.put(key, im)
+        return [im] * count
 
 
-def get_template() -> Image:
-    return open_image("template.jpg")
+def get_card_key(toml_dict: dict[str, Any], layout: Layout) -> str:
+    dependencies = list(layout.dependencies)
+    if toml_dict.get("image_path"):
+        dependencies.append(f"images/{toml_dict['image_path']}")
+    return card_key(toml_dict, dependencies, layout.fingerprint)
 
 
-def add_text(im: Image, toml_dict: dict[str, Any]):
-    name_box.add_text(im, toml_dict["name"])
+def get_subtitle(toml_dict: dict[str, Any]) -> str:
     subtitle = toml_dict["type"]
     if toml_dict.get("requires_attunement"):
         subtitle += " (requires attunement)"
-    subtitle_box.add_text(im, subtitle)
-    add_image(im, toml_dict["image_path"], *picture_coords)
-    description_box.add_text(im, toml_dict["description"])
+    return subtitle
+
+
+def add_text(im: Image, toml_dict: dict[str, Any], layout: Layout):
+    from pil_helpers import add_image
 
+    with profiler.stage("name text"):
+        layout.boxes["name"].add_text(im, toml_dict["name"])
+    with profiler.stage("subtitle text"):
+        layout.boxes["subtitle"].add_text(im, get_subtitle(toml_dict))
+    with profiler.stage("image"):
+        add_image(im, toml_dict["image_path"], *layout.picture_coords, cache=get_artwork())
+    with profiler.stage("description text"):
+        layout.boxes["description"].add_text(im, toml_dict["description"])
 
-def add_qr_code(im: Image, toml_dict: dict[str, Any]):
+
+def get_qr_url(toml_dict: dict[str, Any]) -> Optional[str]:
     if "url" in toml_dict:
-        if toml_dict["url"] is None:
-            return
-        else:
-            url = toml_dict["url"]
-    else:
-        url = f"wiki.harebrained.dev/s/em/{toml_dict['name']}"
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=5,
-        border=2,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_img: Image = qr.make_image()
+        return toml_dict["url"]
+    return f"wiki.harebrained.dev/s/em/{toml_dict['name']}"
+
+
+def pregenerate_qr_codes(card_list_rows: list[CardListRow], scale: float = 1):
+    """
+    Builds every QR code the deck needs before any cards are composited. They're also saved to the QR cache folder,
+    which is where worker processes in --jobs mode pick them up from. With the disk caches off, forked workers start
+    out with them in memory instead, and spawned ones generate their own.
+    """
+    urls: dict[str, list[str]] = {}
+    for row in card_list_rows:
+        toml_dict = load_card_toml(row["filepath"])
+        if "url" in toml_dict and not toml_dict.get("image_is_card") and get_qr_url(toml_dict) is not None:
+            urls.setdefault(get_layout(row["filepath"], toml_dict, scale).name, []).append(get_qr_url(toml_dict))
+    if urls:
+        layouts = get_layouts(scale=scale)
+        generated = sum(layouts[name].qr_codes.pregenerate(layout_urls) for name, layout_urls in urls.items())
+        print(f"Generated {generated} new QR codes")
+
+
+def add_qr_code(im: Image, toml_dict: dict[str, Any], layout: Layout):
+    url = get_qr_url(toml_dict)
+    if url is None:
+        return
+    qr_img = layout.qr_codes.get(url)
     qr_width, qr_height = qr_img.size
     width, _ = im.size
-    im.paste(qr_img, (width - qr_width - 30, 580 - qr_height))
+    im.paste(qr_img, (width - qr_width - layout.qr_coords[0], layout.qr_coords[1] - qr_height))
+
 
+def gen_chunks(chunk_list: Iterable, n: int) -> Iterator[list]:
+    iterator = iter(chunk_list)
+    while chunk := list(islice(iterator, n)):
+        yield chunk
 
-def gen_chunks(chunk_list, n):
-    for i in range(0, len(chunk_list), n):
-        yield chunk_list[i:i + n]
 
+def save_cards_to_pages(card_list: Iterable[RenderedCard], grid: Tuple[int, int] = (3, 3), folder: str = "pages",
+                        image_format: str = "png", compress_level: int = 6, quality: int = 90, threads: int = 0,
+                        dpi: int = 300, max_pending: int = MAX_PENDING_PAGES):
+    """
+    Fills one page at a time and hands it to a PageWriter, which encodes pages on a pool of threads while the next ones
+    are being filled. Only a few pages' worth of cards need to be held at once when card_list is a generator: the cards
+    of the page being filled, and at most max_pending pages waiting to be encoded.
+    Pages with the same cards in the same slots are only encoded once, which is told apart by the cards' files.
+    """
+    from pil_helpers import compose_page
 
-def save_cards_to_pages(card_list: List[Image], grid: Tuple[int, int] = (3, 3), folder: str = "pages"):
     os.makedirs(f"output/{folder}", exist_ok=True)
-    for i, chunk in enumerate(gen_chunks(card_list, grid[0] * grid[1])):
-        filename = f"output/{folder}/{i + 1:>03}.png"
-        print(f"Saving {filename}")
-        save_page(chunk, grid, filename, cut_line_width=0)
+    with PageWriter(dpi, image_format, compress_level, quality, threads, max_pending) as writer:
+        for i, chunk in enumerate(gen_chunks(card_list, grid[0] * grid[1])):
+            filename = get_page_filename(folder, i, PAGE_FORMATS[image_format])
+            print(f"Saving {filename}")
+            with profiler.stage("page compose"):
+                page = compose_page([card.image for card in chunk], grid, cut_line_width=0, dpi=dpi)
+            writer.add_page(page, filename, key=(tuple(card.filepath for card in chunk), grid))
+    if writer.reused:
+        print(f"Reused {writer.reused} identical pages instead of encoding them again")
+
+
+def get_page_filename(folder: str, index: int, extension: str = "png") -> str:
+    return f"output/{folder}/{index + 1:>03}.{extension}"
+
+
+def save_cards_to_pdf(card_list: Iterable[RenderedCard], grid: Tuple[int, int] = (3, 3), filename: str = "pages",
+                      compression: str = "jpeg", quality: int = 90, dpi: int = 300):
+    """
+    Like save_cards_to_pages, but each page is appended to a single PDF as soon as it's filled, instead of being saved
+    as a PNG of its own.
+    """
+    from pil_helpers import compose_page
 
+    os.makedirs("output", exist_ok=True)
+    filename = f"output/{filename}.pdf"
+    print(f"Saving {filename}")
+    with PdfWriter(filename, dpi=dpi, compression=compression, quality=quality) as pdf:
+        for chunk in gen_chunks(card_list, grid[0] * grid[1]):
+            with profiler.stage("page compose"):
+                page = compose_page([card.image for card in chunk], grid, cut_line_width=0, dpi=dpi)
+            with profiler.stage("page encode"):
+                pdf.add_page(page)
+            print(f"Saved page {pdf.page_count}")
 
-def main():
+
+def cache_command(args):
+    import artwork_cache
+    import qr_cache
+
+    for cache in (CardCache(), CardCache(artwork_cache.CACHE_FOLDER), CardCache(qr_cache.CACHE_FOLDER)):
+        if args.cache_command == "prune":
+            max_bytes = int(args.max_size * 1024 * 1024) if args.max_size is not None else None
+            removed, freed = cache.prune(max_bytes=max_bytes, max_age_days=args.older_than)
+            print(f"{cache.folder}: removed {removed} entries ({freed / 1024 / 1024:.1f} MB)")
+        elif args.cache_command == "clear":
+            removed, freed = cache.clear()
+            print(f"{cache.folder}: removed {removed} entries ({freed / 1024 / 1024:.1f} MB)")
+        else:
+            stats = cache.stats()
+            print(f"Folder: {stats['folder']}")
+            print(f"Entries: {stats['entries']}")
+            print(f"Total size: {stats['total_bytes'] / 1024 / 1024:.1f} MB")
+            print(f"Least recently used: {stats['oldest']}")
+            print(f"Most recently used: {stats['newest']}")
+
+
+def catalog_command(args):
+    items = get_catalog().query(rarity=args.rarity, item_type=args.item_type, requires_attunement=args.attunement,
+                                name=args.name)
+    if args.catalog_command == "csv":
+        build_card_list(items)
+        print(f"Wrote {len(items)} items to card_list.csv")
+        return
+    for item in items:
+        print(f"{item.name or '':<40}{item.rarity_folder:<12}{item.type or '':<50}{item.path}")
+    print(f"{len(items)} items")
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description="Builds printable pages of item cards from the cards listed in card_list.csv")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Render every card, ignoring the card cache, and don't read or write fitted artwork or "
+                             "QR codes in cache/artwork and cache/qr either")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes to render cards with. 0 uses every core.")
+    parser.add_argument("--format", choices=[*PAGE_FORMATS, "pdf"], default="png",
+                        help="Save each page as its own image in output/pages, or all pages to output/pages.pdf")
+    parser.add_argument("--pdf-compression", choices=COMPRESSIONS, default="jpeg",
+                        help="How page images are compressed in the PDF. jpeg is much smaller, flate is lossless.")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="PNG compression level. Lower levels encode much faster, but make bigger files.")
+    parser.add_argument("--quality", type=int, default=90,
+                        help="JPEG and WebP quality, including JPEG compressed PDF pages")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="Render a quick proof at this fraction of print size, e.g. 0.5 or 0.25, into "
+                             "output/proofs. Text wraps exactly like it does at full size.")
+    parser.add_argument("--encode-threads", type=int, default=0,
+                        help="Number of threads to encode pages with, up to --pending-pages. 0 uses as many as it can.")
+    parser.add_argument("--pending-pages", type=int, default=MAX_PENDING_PAGES,
+                        help=f"Most composed pages to hold in memory while they wait to be encoded, about 25 MB each "
+                             f"(default {MAX_PENDING_PAGES})")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time every stage of every card and page, and print a summary when done")
+    parser.add_argument("--profile-json", metavar="FILE", help="With --profile, also save every timing record as JSON")
+    parser.add_argument("--profile-cprofile", metavar="FILE",
+                        help="With --profile, also run the build under cProfile and save the stats, for pstats or "
+                             "snakeviz")
+    parser.add_argument("--profile-tracemalloc", metavar="FILE",
+                        help="With --profile, also save a tracemalloc snapshot of the Python memory still allocated at "
+                             "the end of the build")
+    parser.add_argument("--prefetch", type=int,
+                        help="With --jobs, the most cards to render ahead of the page being filled. Defaults to twice "
+                             "the number of processes.")
+    subparsers = parser.add_subparsers(dest="command")
+    catalog_parser = subparsers.add_parser("catalog", help="List items from the item catalog, or pick a deck from it")
+    catalog_parser.add_argument("catalog_command", nargs="?", choices=["list", "csv"], default="list",
+                                help="list prints the matching items. csv overwrites card_list.csv with one of each "
+                                     "matching item.")
+    catalog_parser.add_argument("--rarity", help="Rarity folder, e.g. common, uncommon, key_items or treasure")
+    catalog_parser.add_argument("--type", dest="item_type", help="Text in the item's type, e.g. potion. * matches "
+                                                                  "anything.")
+    catalog_parser.add_argument("--attunement", action=BooleanOptionalAction,
+                                help="Only items that do (or with --no-attunement, don't) require attunement")
+    catalog_parser.add_argument("--name", help="Name pattern, e.g. '*healing*'")
+    validate_parser = subparsers.add_parser("validate", help="Check that every card's text fits and its artwork is "
+                                                             "usable, without rendering anything")
+    validate_parser.add_argument("paths", nargs="*", help="Item TOMLs to check. Defaults to the cards in "
+                                                          "card_list.csv, or every item with --all or without one.")
+    validate_parser.add_argument("--all", action="store_true", help="Check every item in the items folder")
+    validate_parser.add_argument("--min-font-size", type=int, default=20,
+                                 help="Warn about text that has to shrink below this size to fit")
+    validate_parser.add_argument("-v", "--verbose", action="store_true",
+                                 help="Show the font size, line count and fill of every box, not just problems")
+    watch_parser = subparsers.add_parser("watch", help="Keep running, and re-render only the cards and pages affected "
+                                                       "whenever items, images, fonts, the template or card_list.csv "
+                                                       "change")
+    watch_parser.add_argument("--interval", type=float, default=0.25, help="Seconds between checks for changes")
+    serve_parser = subparsers.add_parser("serve", help="Run a local HTTP server that renders card previews on "
+                                                       "demand, keeping fonts, artwork and QR codes warm in memory")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    serve_parser.add_argument("--workers", type=int, default=0,
+                              help="Number of processes to render previews with. 0 uses every core.")
+    cache_parser = subparsers.add_parser("cache", help="Inspect or clean up the card, artwork and QR code caches")
+    cache_parser.add_argument("cache_command", nargs="?", choices=["stats", "prune", "clear"], default="stats")
+    cache_parser.add_argument("--max-size", type=float, help="Evict least recently used entries until each cache "
+                                                             "fits in this many MB")
+    cache_parser.add_argument("--older-than", type=float, help="Evict entries that haven't been used in this many "
+                                                               "days")
+    args = parser.parse_args(argv)
+    if not 0 < args.scale <= 1:
+        parser.error("--scale has to be more than 0 and at most 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.no_cache:
+        set_disk_caches(False)
+    if args.command == "cache":
+        cache_command(args)
+        return
+    if args.command == "catalog":
+        catalog_command(args)
+        return
+    if args.command == "validate":
+        from validate import validate
+        try:
+            paths = get_paths_to_validate(args.paths, args.all)
+        except Exception as e:
+            print(f"Can't list the cards to check: {e}")
+            return 1
+        return 1 if validate(paths, args.min_font_size, args.verbose) else 0
+    if args.command == "serve":
+        from server import serve
+        serve(args.host, args.port, args.workers)
+        return
+    if args.command == "watch":
+        from watch import watch
+        watch(cache=None if args.no_cache else CardCache(), interval=args.interval)
+        return
     toml_dicts = get_card_list()
     if toml_dicts is None:
         return
-    build_cards(toml_dicts)
+    if args.profile:
+        profiler.enable()
+    profile = None
+    if args.profile and args.profile_cprofile:
+        import cProfile
+
+        profile = cProfile.Profile()
+    if profile is not None:
+        profile.enable()
+    build_cards(toml_dicts, cache=None if args.no_cache else CardCache(), jobs=args.jobs,
+                prefetch=args.prefetch, output_format=args.format, pdf_compression=args.pdf_compression,
+                compress_level=args.compress_level, quality=args.quality, encode_threads=args.encode_threads,
+                scale=args.scale, pending_pages=args.pending_pages)
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profile_cprofile)
+    if args.profile:
+        print(profiler.summary())
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+        if args.profile_tracemalloc:
+            import tracemalloc
+
+            tracemalloc.take_snapshot().dump(args.profile_tracemalloc)
     # im = build_card("items/magic_items/common/mystery_key.toml")
     # im[0].show()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from collections import deque
+from typing import Any, Hashable, Optional, TYPE_CHECKING
+
+from profiling import profiler
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from PIL.Image import Image
+
+# Page formats, and the extension their files get
+PAGE_FORMATS = {"png": "png", "jpeg": "jpg", "webp": "webp", "tiff": "tif"}
+# A full page is 2550x3300 RGB, about 25 MB, so only a couple are kept waiting to be encoded by default
+MAX_PENDING_PAGES = 2
+
+
+def get_save_options(image_format: str = "png", compress_level: int = 6, quality: int = 90) -> dict[str, Any]:
+    """
+    The Image.save arguments for a page format. compress_level only applies to PNG, and quality to JPEG and WebP.
+    """
+    if image_format == "png":
+        return {"format": "PNG", "compress_level": compress_level}
+    elif image_format == "jpeg":
+        return {"format": "JPEG", "quality": quality}
+    elif image_format == "webp":
+        return {"format": "WEBP", "quality": quality}
+    elif image_format == "tiff":
+        return {"format": "TIFF", "compression": "tiff_adobe_deflate"}
+    raise ValueError(f"Invalid page format: {image_format}")
+
+
+class PageWriter:
+    """
+    Saves pages on a pool of threads, so the next page can be composed while earlier ones are still being encoded.
+    Pillow's encoders let go of the GIL, so the threads really do encode in parallel.
+    At most max_pending pages are held at once, waiting to be encoded, however many threads there are, so memory stays
+    at a few pages. There's no use in more threads than that, so there are never more.
+    A page added with the same key as one that was already saved, like a second full sheet of the same potion, isn't
+    encoded again: its file is copied from the first one's. The key stands for what's on the page, like the cards on
+    it, so telling pages apart never needs their pixels.
+    """
+
+    def __init__(self, dpi: int = 300, image_format: str = "png", compress_level: int = 6, quality: int = 90,
+                 threads: int = 0, max_pending: int = MAX_PENDING_PAGES):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.dpi = dpi
+        self.save_options = get_save_options(image_format, compress_level, quality)
+        self.max_pending = max(max_pending, 1)
+        self.threads = min(threads if threads > 0 else os.cpu_count(), self.max_pending)
+        self.page_count, self.reused = 0, 0
+        self._executor = ThreadPoolExecutor(max_workers=self.threads)
+        # Pages waiting to be encoded or copied, in the order they were added
+        self._pending: deque[tuple[str, Future, str]] = deque()
+        # The file and encoding future of the first page saved with each key
+        self._saved: dict[Hashable, tuple[str, Future]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_page(self, page: Image, filename: str, key: Optional[Hashable] = None):
+        """
+        Queues the page to be saved to filename. Pages without a key are always encoded.
+        """
+        if key is not None and key in self._saved:
+            first_filename, future = self._saved[key]
+            self._pending.append((filename, future, first_filename))
+            self.reused += 1
+        else:
+            future = self._executor.submit(self._encode, page, filename)
+            if key is not None:
+                self._saved[key] = (filename, future)
+            self._pending.append((filename, future, filename))
+        self.page_count += 1
+        while len(self._pending) > self.max_pending:
+            self._finish_oldest()
+
+    def close(self):
+        while self._pending:
+            self._finish_oldest()
+        self._executor.shutdown()
+
+    def _finish_oldest(self):
+        filename, future, source = self._pending.popleft()
+        seconds = future.result()
+        if source != filename:
+            shutil.copyfile(source, filename)
+        else:
+            profiler.record("page encode", seconds)
+
+    def _encode(self, page: Image, filename: str) -> float:
+        start = time.perf_counter()
+        page.save(filename, dpi=(self.dpi, self.dpi), **self.save_options)
+        return time.perf_counter() - start
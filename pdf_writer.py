@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import struct
+from io import BytesIO
+from typing import Optional, BinaryIO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+
+COMPRESSIONS = ("jpeg", "flate")
+
+
+class PdfWriter:
+    """
+    Writes a multi-page PDF one page at a time. Each page is a single full-page image, written to the file as soon as
+    it's added, so only the page currently being added is ever held in memory.
+    Pages are sized so that their images print at the given dpi, and each one can be compressed as JPEG (DCTDecode,
+    small and lossy) or Flate (lossless).
+    """
+
+    def __init__(self, filename: str, dpi: int = 300, compression: str = "jpeg", quality: int = 90):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Invalid compression value: {compression}")
+        self.dpi, self.compression, self.quality = dpi, compression, quality
+        self._file: Optional[BinaryIO] = open(filename, "wb")
+        # Object 1 is the catalog and object 2 is the page tree, which is written last, once all the pages are known
+        self._offsets: dict[int, int] = {}
+        self._next_object = 3
+        self._page_objects: list[int] = []
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_page(self, im: Image, compression: Optional[str] = None, quality: Optional[int] = None):
+        compression = compression or self.compression
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        width, height = im.size
+        if compression == "jpeg":
+            buffer = BytesIO()
+            im.save(buffer, format="JPEG", quality=quality or self.quality, dpi=(self.dpi, self.dpi))
+            data, pdf_filter = buffer.getvalue(), b"/DCTDecode"
+            decode_parms = b""
+        elif compression == "flate":
+            data, pdf_filter = get_png_image_data(im), b"/FlateDecode"
+            # The PNG row filters have to be undone after inflating
+            decode_parms = b" /DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >>" % width
+        else:
+            raise ValueError(f"Invalid compression value: {compression}")
+
+        image_object = self._allocate_object()
+        self._write_stream(image_object, b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                                         b"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter %s%s"
+                           % (width, height, pdf_filter, decode_parms), data)
+        # Scale the image to the page, which is measured in points (1/72 inch)
+        page_width, page_height = width * 72 / self.dpi, height * 72 / self.dpi
+        contents_object = self._allocate_object()
+        self._write_stream(contents_object, b"", b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_width, page_height))
+        page_object = self._allocate_object()
+        self._write_object(page_object, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] "
+                                        b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                           % (page_width, page_height, image_object, contents_object))
+        self._page_objects.append(page_object)
+
+    def close(self):
+        if self._file is None:
+            return
+        kids = b" ".join(b"%d 0 R" % n for n in self._page_objects)
+        self._write_object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_objects)))
+        xref_offset = self._file.tell()
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_object)
+        for n in range(1, self._next_object):
+            self._file.write(b"%010d 00000 n \n" % self._offsets[n])
+        self._file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                         % (self._next_object, xref_offset))
+        self._file.close()
+        self._file = None
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_objects)
+
+    def _allocate_object(self) -> int:
+        n = self._next_object
+        self._next_object += 1
+        return n
+
+    def _write_object(self, n: int, body: bytes):
+        self._offsets[n] = self._file.tell()
+        self._file.write(b"%d 0 obj\n%s\nendobj\n" % (n, body))
+
+    def _write_stream(self, n: int, dictionary: bytes, data: bytes):
+        self._offsets[n] = self._file.tell()
+        self._file.write(b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (n, dictionary, len(data)))
+        self._file.write(data)
+        self._file.write(b"\nendstream\nendobj\n")
+
+
+def get_png_image_data(im: Image) -> bytes:
+    """
+    Encodes the image as a PNG and pulls out its zlib stream. That stream is exactly what PDF's Flate filter expects
+    with the PNG predictors turned on, so it gets PNG's compression ratio at PNG's encoding speed.
+    """
+    buffer = BytesIO()
+    im.save(buffer, format="PNG")
+    png = buffer.getvalue()
+    chunks = []
+    position = 8  # Skip the PNG signature
+    while position < len(png):
+        length, chunk_type = struct.unpack(">I4s", png[position:position + 8])
+        if chunk_type == b"IDAT":
+            chunks.append(png[position + 8:position + 8 + length])
+        position += 12 + length
+    return b"".join(chunks)
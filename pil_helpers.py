@@ -1,33 +1,183 @@
 import os
-from typing import Tuple, Union, List
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Tuple, Union, List, Optional, Sequence, NamedTuple
 
-from PIL import ImageFont, ImageDraw, Image, ImageOps
+from PIL import ImageFont, ImageDraw, Image, ImageColor
 
 from enums import HAlign, VAlign
+from profiling import profiler
 
 DEBUG_TEXT_BOX_BORDERS = False
-FONTS_FOLDER = os.environ["FONTS_FOLDER"]  # Usually found at C:\Users\<user>\AppData\Local\Microsoft\Windows\Fonts\
 DEFAULT_FONT = "fonts/Noteworthy-Lt.ttf"
 
 
+def get_fonts_folder() -> Optional[str]:
+    """
+    The FONTS_FOLDER environment variable, if it's set. Fonts that aren't found at their own path are looked for there.
+    """
+    return os.environ.get("FONTS_FOLDER")  # Usually found at C:\Users\<user>\AppData\Local\Microsoft\Windows\Fonts\
+
+
+def find_font(font_name: str) -> str:
+    if os.path.isfile(font_name):
+        return font_name
+    fonts_folder = get_fonts_folder()
+    if fonts_folder:
+        installed = os.path.join(fonts_folder, os.path.basename(font_name))
+        if os.path.isfile(installed):
+            return installed
+    # Let Pillow search its own font paths, and raise if it's nowhere
+    return font_name
+
+
+class TextLayer(NamedTuple):
+    picture: Image
+    mask: Image
+    coords: Tuple[int, int]
+    text_size: Tuple[float, int]
+
+
+class TextLayerCache:
+    """
+    Keeps the colorized layer, mask and position of text boxes that have already been drawn, so text that comes up on
+    many cards, like "potion, common", is only fitted, wrapped and rasterized once. The least recently used layers are
+    dropped once they take up more than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._layers: OrderedDict[tuple, TextLayer] = OrderedDict()
+        self._total_bytes = 0
+        self.hits, self.misses = 0, 0
+
+    def get(self, key: tuple) -> Optional[TextLayer]:
+        layer = self._layers.get(key)
+        if layer is None:
+            self.misses += 1
+            return None
+        self._layers.move_to_end(key)
+        self.hits += 1
+        return layer
+
+    def put(self, key: tuple, layer: TextLayer):
+        self._layers[key] = layer
+        # The picture is RGB and the mask is L, so 4 bytes a pixel
+        self._total_bytes += layer.mask.width * layer.mask.height * 4
+        while self._total_bytes > self.max_bytes and len(self._layers) > 1:
+            _, evicted = self._layers.popitem(last=False)
+            self._total_bytes -= evicted.mask.width * evicted.mask.height * 4
+
+    def clear(self):
+        self._layers.clear()
+        self._total_bytes = 0
+
+
+text_layers = TextLayerCache()
+
+
 def open_image(filepath: str) -> Image:
     return Image.open(filepath)
 
 
+@lru_cache(maxsize=256)
 def build_font(font_name, font_size) -> ImageFont:
-    return ImageFont.truetype(font_name, font_size)
+    """
+    Fonts are cached by (path, size), so each size of each font is only loaded from disk once. The returned font
+    objects are shared, so don't modify them.
+    """
+    return ImageFont.truetype(find_font(font_name), font_size)
+
+
+@lru_cache(maxsize=65536)
+def get_text_length(font: ImageFont, text: str) -> float:
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=4096)
+def get_kerning(font: ImageFont, left: str, right: str) -> float:
+    """
+    The adjustment the font makes to the advance between two characters when they're next to each other
+    """
+    return get_text_length(font, left + right) - get_text_length(font, left) - get_text_length(font, right)
+
+
+def get_line_length_with_word(font: ImageFont, line_words: List[str], line_width: float, word: str) -> float:
+    """
+    Width of a line whose words are each followed by a space, plus another space and the next word
+    """
+    width = get_text_length(font, " " + word)
+    if line_words:
+        width += line_width + get_kerning(font, " ", " ")
+    return width
+
+
+def add_word_to_line_length(font: ImageFont, line_words: List[str], line_width: float, word: str) -> float:
+    """
+    Appends the word to line_words, and returns the new width of the line with a space after the word
+    """
+    if line_words:
+        line_width += get_kerning(font, " ", (word or " ")[0])
+    line_words.append(word)
+    return line_width + get_text_length(font, word + " ")
+
+
+def wrap_text_by_measuring_lines(text: str, font: ImageFont, max_width: float) -> str:
+    """
+    TextBox.wrap_text for fonts whose line widths can't be added up from their words, measuring the whole line for
+    every word. It's quadratic in the length of a line, but gives exactly the same line breaks under any layout engine.
+    """
+    temp = ""
+    wrapped_text = ""
+
+    for w in text.split(' '):
+        # Add words to empty string until the next word would make the line too long
+        # If next word contains a newline, check only first word before newline for width match
+        if "\n" in w:
+            wrapped_text += temp.strip(' ')
+            width = font.getlength("{} {}".format(temp, w.partition('\n')[0]))
+            # If adding one last word before the line break will exceed max width
+            # Add in a line break before last word.
+            if width > max_width:
+                wrapped_text += "\n"
+            else:
+                wrapped_text += " "
+            par = w.rpartition('\n')
+            wrapped_text += par[0] + "\n"
+            temp = par[2] + " "
+        else:
+            width = font.getlength(u"{0} {1}".format(temp, w))
+            if width > max_width:
+                wrapped_text += temp.strip(' ') + "\n"
+                temp = ""
+            temp += w + " "
+    return wrapped_text + temp.strip(' ')
+
+
+def get_line_width(font: ImageFont, line: str) -> int:
+    """
+    Width of the ink of a line, which is what has to fit in a text box
+    """
+    left, top, right, bottom = font.getbbox(line)
+    return right - left
 
 
 class TextBox:
 
     def __init__(self, x, y, w, h, halign: HAlign = HAlign.CENTER, valign: VAlign = VAlign.CENTER,
                  font_name: str = DEFAULT_FONT, font_size: int = 32, rotate: int = 0,
-                 use_height_for_text_wrap: bool = False, shrink_font_size_to_fit: bool = False):
+                 use_height_for_text_wrap: bool = False, shrink_font_size_to_fit: bool = False, scale: float = 1):
+        """
+        The box is always given at print size. With a scale, text is still fitted and wrapped at print size, so lines
+        break in exactly the same places, but it's drawn that much smaller, onto a card scaled down by the same amount.
+        """
         self.x, self.y, self.width, self.height = x, y, w, h
         self.halign, self.valign, self.rotate = halign, valign, rotate
         self.use_height_for_text_wrap = use_height_for_text_wrap
         self.shrink_font_to_fit = shrink_font_size_to_fit
         self.font_name, self.font_size = font_name, font_size
+        self.scale = scale
+        self.anchor = tuple(round(v * scale) for v in get_anchors(x, y, w, h, halign, valign))
 
     @staticmethod
     def wrap_text(text, font, max_width=0):
@@ -35,38 +185,56 @@ class TextBox:
         Wraps text properly, so that each line does not exceed a maximum width in pixels. It does this by adding words
         in the string to the line, one by one, until the next word would make the line longer than the maximum width.
         It then starts a new line with that word instead.
-        New lines get special treatment. It's kind of funky.
-        "Words" are split around spaces.
+        "Words" are split around spaces, so a run of spaces counts as empty words between them. Each word is measured
+        once per font and cached, and the width of the current line is kept as a running total, so wrapping takes
+        linear time. The running total is exactly what font.getlength would measure for the line, kerning included,
+        under Pillow's basic layout engine. Fonts using Raqm are wrapped by measuring each whole line instead.
+        New lines get special treatment. It's kind of funky:
+        * A word containing a newline always ends the current line. Everything in the word up to its last newline is
+          kept as is, and whatever follows that newline starts the next line.
+        * If the part of that word before its first newline wouldn't fit on the current line, it gets pushed down onto
+          a line of its own.
+        * If that word is the very first word in the text, its first line starts with a space (or is blank, if the part
+          before its newline is too wide).
+        * The width check compares against the line plus the next word with two spaces between them, and a word that
+          doesn't fit on an empty line leaves a blank line behind it.
         """
         text = text.strip("\n")
         if max_width <= 0:
             return text
+        if font.layout_engine != ImageFont.Layout.BASIC:
+            # Raqm shapes whole runs of text, so a line isn't always as wide as its words and kerning pairs add up to
+            return wrap_text_by_measuring_lines(text, font, max_width)
 
-        temp = ""
-        wrapped_text = ""
+        # The current line is kept as a list of words, each of which would be followed by a space
+        line_words = []
+        line_width = 0.0
+        wrapped_text = []
 
         for w in text.split(' '):
             # Add words to empty string until the next word would make the line too long
             # If next word contains a newline, check only first word before newline for width match
             if "\n" in w:
-                wrapped_text += temp.strip(' ')
-                width = font.getlength("{} {}".format(temp, w.partition('\n')[0]))
+                wrapped_text.append(" ".join(line_words).strip(' '))
+                width = get_line_length_with_word(font, line_words, line_width, w.partition('\n')[0])
                 # If adding one last word before the line break will exceed max width
                 # Add in a line break before last word.
                 if width > max_width:
-                    wrapped_text += "\n"
+                    wrapped_text.append("\n")
                 else:
-                    wrapped_text += " "
+                    wrapped_text.append(" ")
                 par = w.rpartition('\n')
-                wrapped_text += par[0] + "\n"
-                temp = par[2] + " "
+                wrapped_text.append(par[0] + "\n")
+                line_words, line_width = [], 0.0
+                line_width = add_word_to_line_length(font, line_words, line_width, par[2])
             else:
-                width = font.getlength(u"{0} {1}".format(temp, w))
+                width = get_line_length_with_word(font, line_words, line_width, w)
                 if width > max_width:
-                    wrapped_text += temp.strip(' ') + "\n"
-                    temp = ""
-                temp += w + " "
-        return wrapped_text + temp.strip(' ')
+                    wrapped_text.append(" ".join(line_words).strip(' ') + "\n")
+                    line_words, line_width = [], 0.0
+                line_width = add_word_to_line_length(font, line_words, line_width, w)
+        wrapped_text.append(" ".join(line_words).strip(' '))
+        return "".join(wrapped_text)
 
     def get_text_block_size(self, text: str, font: ImageFont, leading_offset: int = 0) -> Tuple[List[str], int, int]:
         wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
@@ -78,48 +246,85 @@ class TextBox:
         # Get max line width
         max_line_width = 0
         for line in lines:
-            # line_width, line_height = font.getsize(line)
-            left, top, right, bottom = font.getbbox(line)
             # Keep track of the longest line width
-            max_line_width = max(max_line_width, right - left)
+            max_line_width = max(max_line_width, get_line_width(font, line))
 
         return lines, max_line_width, len(lines) * leading
 
     def shrink_font_until_text_fits(self, text: str, font_name: str, starting_font_size: int, width: int, height: int
                                     ) -> Tuple[List[str], ImageFont]:
+        """
+        Finds the largest font size, no bigger than starting_font_size, at which the text fits in width x height, by
+        stepping down one point at a time.
+        Whether text fits isn't monotonic in the font size: a smaller size can wrap into one more line than a bigger
+        one, and overflow where the bigger size didn't. So the sizes are tried in order rather than bisected, which
+        could skip past the largest size that fits. Fonts and word widths are cached, so each step is cheap, and each
+        step makes the same check as get_text_block_size, but checks the height before measuring any lines, and stops
+        measuring at the first line that's too wide.
+        """
         font_size = starting_font_size
         while font_size > 0:
+            profiler.note(fit_iterations=starting_font_size - font_size + 1)
             font = build_font(font_name, font_size)
-            text_lines, block_width, block_height = self.get_text_block_size(text, font)
-            if block_width <= width and block_height <= height:
+            wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
+            text_lines = wrapped_text.split('\n')
+            leading = font.font.ascent + font.font.descent
+            if len(text_lines) * leading <= height and all(get_line_width(font, line) <= width for line in text_lines):
                 # print(f"Final font size: {font_size}")
                 return text_lines, font
             font_size -= 1
         else:
             raise ValueError("Text is too big to fit in the text box at any font size")
 
+    def layout(self, text: str) -> Tuple[List[str], ImageFont]:
+        """
+        Works out the font and line breaks add_text would use for the text, without drawing anything.
+        """
+        if self.shrink_font_to_fit:
+            return self.shrink_font_until_text_fits(text, self.font_name, self.font_size, self.width, self.height)
+        font = build_font(self.font_name, self.font_size)
+        # print(f"Final font size: {self.font_size}")
+        wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
+        return wrapped_text.split('\n'), font
+
     def add_text(self, image: Image, text: str, color: Union[str, Tuple[int, int, int]] = "black",
                  leading_offset: int = 0):
         """
-        First, attempt to wrap the text if max_width is set, and creates a list of each line. Then paste each
-        individual line onto a transparent layer one line at a time, taking into account halign. Then rotate the layer,
-        and paste on the image according to the anchor point, halign, and valign.
+        Pastes the text onto the image. Text this box has drawn before, in the same color, comes from the text layer
+        cache, without fitting, wrapping or rasterizing it again.
 
         @return (int, int): Total width and height of the text block added, in pixels.
         """
-        if self.shrink_font_to_fit:
-            text_lines, font = self.shrink_font_until_text_fits(
-                text, self.font_name, self.font_size, self.width, self.height
-            )
-        else:
-            font = build_font(self.font_name, self.font_size)
-            # print(f"Final font size: {self.font_size}")
-            wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
-            text_lines = wrapped_text.split('\n')
+        key = (self.x, self.y, self.width, self.height, self.halign, self.valign, self.font_name, self.font_size,
+               self.rotate, self.use_height_for_text_wrap, self.shrink_font_to_fit, self.scale, text, color,
+               leading_offset)
+        layer = text_layers.get(key)
+        if layer is None:
+            layer = self.render_text_layer(text, color, leading_offset)
+            text_layers.put(key, layer)
+        image.paste(layer.picture, layer.coords, layer.mask)
 
-        # Initialize layer and draw object
-        layer = Image.new('L', (5000, 5000))
-        draw = ImageDraw.Draw(layer)
+        # Add debug box if the flag is set
+        if DEBUG_TEXT_BOX_BORDERS:
+            draw_box(image, *(round(v * self.scale) for v in (self.x, self.y, self.width, self.height)))
+
+        return layer.text_size
+
+    def render_text_layer(self, text: str, color: Union[str, Tuple[int, int, int]] = "black",
+                          leading_offset: int = 0) -> TextLayer:
+        """
+        First, attempt to wrap the text if max_width is set, and creates a list of each line. Then paste each
+        individual line onto a transparent layer one line at a time, taking into account halign. Then rotate the layer,
+        and work out where it goes on the card according to the anchor point, halign, and valign.
+        """
+        text_lines, font = self.layout(text)
+        if self.scale != 1:
+            # Rounding down keeps scaled lines from coming out any wider than their box
+            font = build_font(self.font_name, max(1, int(font.size * self.scale)))
+            leading_offset = round(leading_offset * self.scale)
+
+        # Lines are positioned on a virtual 5000x5000 canvas, so that sub-pixel offsets and crop rounding stay exactly
+        # the same as they've always been. Only the part of that canvas the text covers actually gets allocated.
         start_y = 500
         if self.halign == HAlign.LEFT:
             start_x = 500
@@ -133,31 +338,14 @@ class TextBox:
         # Set leading
         leading = font.font.ascent + font.font.descent + leading_offset
 
-        # Begin laying down the lines, top to bottom
-        y = start_y
-        max_line_width = 0
-        for line in text_lines:
-            # If current line is blank, just change y and skip to next
-            if not line == "":
-                line_width = font.getlength(line)
-                if self.halign == HAlign.LEFT:
-                    x_pos = start_x
-                elif self.halign == HAlign.CENTER:
-                    x_pos = start_x - (line_width / 2)
-                elif self.halign == HAlign.RIGHT:
-                    x_pos = start_x - line_width
-                else:
-                    raise ValueError(f"Invalid halign value: {self.halign}")
-                # Keep track of the longest line width
-                max_line_width = max(max_line_width, line_width)
-                draw.text((x_pos, y), line, font=font, fill=255)
-            y += leading
-
+        # Measure the lines first, so we know how big the layer needs to be. Blank lines only take up vertical space.
+        line_widths = [font.getlength(line) if line else 0 for line in text_lines]
+        max_line_width = max(line_widths, default=0)
         total_text_size = (max_line_width, len(text_lines) * leading)
 
-        # Now that the text is added to the image, find the crop points
+        # Find the crop points of the text block on the virtual canvas
         top = start_y
-        bottom = y - leading_offset
+        bottom = start_y + len(text_lines) * leading - leading_offset
         if self.halign == HAlign.LEFT:
             left = start_x
             right = start_x + max_line_width
@@ -169,12 +357,35 @@ class TextBox:
             right = start_x
         else:
             raise ValueError(f"Invalid halign value: {self.halign}")
-        layer = layer.crop((left, top, right, bottom))
+        crop_left, crop_top, crop_right, crop_bottom = (round(v) for v in (left, top, right, bottom))
+
+        # Initialize a layer covering just the crop box. ImageDraw truncates the text position towards zero, so the
+        # layer gets one pixel of padding on the left to keep every line at a positive x, same as on the big canvas.
+        origin_x, origin_y = crop_left - 1, crop_top
+        layer = Image.new('L', (crop_right - origin_x, crop_bottom - origin_y))
+        draw = ImageDraw.Draw(layer)
+
+        # Begin laying down the lines, top to bottom
+        y = start_y
+        for line, line_width in zip(text_lines, line_widths):
+            # If current line is blank, just change y and skip to next
+            if not line == "":
+                if self.halign == HAlign.LEFT:
+                    x_pos = start_x
+                elif self.halign == HAlign.CENTER:
+                    x_pos = start_x - (line_width / 2)
+                elif self.halign == HAlign.RIGHT:
+                    x_pos = start_x - line_width
+                else:
+                    raise ValueError(f"Invalid halign value: {self.halign}")
+                draw.text((x_pos - origin_x, y - origin_y), line, font=font, fill=255)
+            y += leading
+        layer = layer.crop((1, 0, layer.width, layer.height))
         # Now that the image is cropped down to just the text, rotate
         if self.rotate != 0:
             layer = layer.rotate(self.rotate, expand=True)
 
-        anchor_x, anchor_y = get_anchors(self.x, self.y, self.width, self.height, self.halign, self.valign)
+        anchor_x, anchor_y = self.anchor
 
         # Determine the anchor point for the new layer
         layer_width, layer_height = layer.size
@@ -195,17 +406,29 @@ class TextBox:
         else:
             raise ValueError(f"Invalid valign value: {self.valign}")
 
-        image.paste(
-            ImageOps.colorize(layer, (255, 255, 255), color),
-            (coords_x, coords_y),
-            layer
-        )
+        return TextLayer(colorize(layer, color), layer, (coords_x, coords_y), total_text_size)
 
-        # Add debug box if the flag is set
-        if DEBUG_TEXT_BOX_BORDERS:
-            draw_box(image, self.x, self.y, self.width, self.height)
 
-        return total_text_size
+@lru_cache(maxsize=64)
+def get_colorize_lut(color: Union[str, Tuple[int, int, int]]) -> List[int]:
+    """
+    The RGB lookup table ImageOps.colorize(layer, (255, 255, 255), color) builds for the color, entry for entry
+    """
+    rgb = color if isinstance(color, tuple) else ImageColor.getrgb(color)
+    lut = []
+    for channel in range(3):
+        # Blank pixels map to white, and fully covered ones to the color
+        lut += [255 + i * (rgb[channel] - 255) // 255 for i in range(255)]
+        lut.append(rgb[channel])
+    return lut
+
+
+def colorize(layer: Image, color: Union[str, Tuple[int, int, int]]) -> Image:
+    """
+    Same as ImageOps.colorize(layer, (255, 255, 255), color), but with the lookup table built once per color instead of
+    on every call
+    """
+    return layer.convert("RGB").point(get_colorize_lut(color))
 
 
 def draw_box(image, x: int, y: int, width: int, height: int, color="red"):
@@ -288,27 +511,41 @@ def get_anchors(x: int, y: int, width: int, height: int, halign: HAlign, valign:
 
 
 def add_image(im: Image, picture_path: str, x: int, y: int, width: int, height: int,
-              halign: HAlign = HAlign.CENTER, valign: VAlign = VAlign.CENTER):
+              halign: HAlign = HAlign.CENTER, valign: VAlign = VAlign.CENTER, cache=None):
+    """
+    Fits the picture inside the box, keeping its aspect ratio, and pastes it centered in the box.
+    If an ArtworkCache is given, the fitted picture comes from it instead of being decoded and resized again.
+    """
     if not picture_path:
         return
     if DEBUG_TEXT_BOX_BORDERS:
         draw_box(im, x, y, width, height)
-    picture: Image = Image.open(f"images/{picture_path}")
+    if cache is None:
+        picture, (offset_x, offset_y) = fit_image(Image.open(f"images/{picture_path}"), width, height)
+        mask = picture if has_transparency(picture) else None
+    else:
+        picture, mask, (offset_x, offset_y) = cache.get(f"images/{picture_path}", width, height)
+    im.paste(picture, box=(x + offset_x, y + offset_y), mask=mask)
+
+
+def fit_image(picture: Image, width: int, height: int) -> Tuple[Image, Tuple[int, int]]:
+    """
+    Resizes the picture to fit inside width x height without changing its aspect ratio.
+
+    @return (Image, (int, int)): The resized picture, and the offset that centers it in the box.
+    """
     picture_ratio = picture.size[0] / picture.size[1]
     background_ratio = width / height
     if picture_ratio < background_ratio:
         new_h = height
         new_w = int(height * picture_ratio)
         picture = picture.resize((new_w, new_h))
-        anchor_x = x + width // 2 - picture.size[0] // 2
-        anchor_y = y
+        return picture, (width // 2 - picture.size[0] // 2, 0)
     else:
         new_w = width
         new_h = int(width / picture_ratio)
         picture = picture.resize((new_w, new_h))
-        anchor_x = x
-        anchor_y = y + height // 2 - picture.size[1] // 2
-    im.paste(picture, box=(anchor_x, anchor_y), mask=picture if has_transparency(picture) else None)
+        return picture, (0, height // 2 - picture.size[1] // 2)
 
 
 def has_transparency(img: Image):
@@ -335,53 +572,48 @@ def has_transparency(img: Image):
     return False
 
 
-def save_page(card_list: List[Image], grid: Tuple[int, int], filename, cut_line_width=3,
-               page_ratio=8.5 / 11.0, h_margin=100):
+def save_page(card_list: Sequence[Image], grid: Tuple[int, int], filename, cut_line_width=3,
+              page_ratio=8.5 / 11.0, h_margin=100, **save_options):
+    """
+    Adds cards, in order, to a grid defined by grid_width, grid_height, centered on a page
+    the size of a sheet of 8.5x11 paper at 300 dpi, and saves to filename. Any save_options, like compress_level, are
+    passed on to Image.save.
+    """
+    with profiler.stage("page compose"):
+        paper_image = compose_page(card_list, grid, cut_line_width)
+    with profiler.stage("page encode"):
+        paper_image.save(filename, dpi=(300, 300), **save_options)
+
+
+def compose_page(card_list: Sequence[Image], grid: Tuple[int, int], cut_line_width=3, dpi: int = 300) -> Image:
     """
-    Adds cards, in order, to a grid defined by grid_width, grid_height.
-    It then adds a border to the grid, making sure to preserve the
-    page ratio for later printing, and saves to filename
+    Adds cards, in order, to a grid defined by grid_width, grid_height, centered on a page
+    the size of a sheet of 8.5x11 paper at 300 dpi (or at dpi, for cards rendered at a smaller scale).
+    Cards are pasted straight onto the page, and any grid slots left over once the cards run out are left blank.
     Assumes that all the cards are the same size
     """
-    # Create card grid based on size of the first card
-    w, h = card_list[0].size
-    bg = Image.new(
-        "RGB",
-        (
-            (w + cut_line_width) * grid[0],
-            (h + cut_line_width) * grid[1]
-        ),
-        color="white"
-    )
-    blank_image = Image.new("RGB", (w, h), color="white")
-    # Add cards to the grid, top down, left to right
-    for y in range(grid[1]):
-        for x in range(grid[0]):
-            if not card_list:
-                # Card list ran out of images. Use blank images to fill out grid remainder
-                card = blank_image
-            else:
-                card = card_list.pop(0)
-            coords = (x * (w + cut_line_width),
-                      y * (h + cut_line_width))
-            bg.paste(card, coords)
-    # If there's a margin defined, add extra whitespace around the page
-    # if h_margin > 0:
-    #     w,h = bg.size
-    #     w_margin = (((h_margin*2)+h)*page_ratio-w)/2.0
-    #     w_margin = round(w_margin)
-    #     page = Image.new("RGB", (int(w+w_margin*2), int(h+h_margin*2)), (255, 255, 255))
-    #     page.paste(bg, (w_margin,h_margin))
-    #     page.save(filename)
-    # else:
-    # bg.save(filename)
     # Create a paper image the exact size of an 8.5x11 paper
     # to paste the card images onto
-    paper_width = int(8.5 * 300)  # 8.5 inches times 300 dpi
-    paper_height = int(11 * 300)  # 11 inches times 300 dpi
+    paper_width = int(8.5 * dpi)  # 8.5 inches times 300 dpi
+    paper_height = int(11 * dpi)  # 11 inches times 300 dpi
     paper_image = Image.new("RGB", (paper_width, paper_height), (255, 255, 255))
-    w, h = bg.size
-    # TODO Add code that shrinks the bg if it's bigger than any dimension
+    # Center the card grid based on size of the first card
+    w, h = card_list[0].size
+    grid_width = (w + cut_line_width) * grid[0]
+    grid_height = (h + cut_line_width) * grid[1]
+    # TODO Add code that shrinks the grid if it's bigger than any dimension
     # of the Paper image
-    paper_image.paste(bg, ((paper_width - w) // 2, (paper_height - h) // 2))
-    paper_image.save(filename, dpi=(300, 300))
+    left = (paper_width - grid_width) // 2
+    top = (paper_height - grid_height) // 2
+    # Add cards to the grid, top down, left to right
+    cards = iter(card_list)
+    for y in range(grid[1]):
+        for x in range(grid[0]):
+            card = next(cards, None)
+            if card is None:
+                # Card list ran out of images. The page is already white, so the grid remainder is done.
+                return paper_image
+            coords = (left + x * (w + cut_line_width),
+                      top + y * (h + cut_line_width))
+            paper_image.paste(card, coords)
+    return paper_image
@@ -0,0 +1,118 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Optional
+
+
+class StageProfiler:
+    """
+    Records the wall time and allocations of each stage of the render pipeline, for every card and page.
+    Allocations are measured two ways: Python memory through tracemalloc (net change and peak during the stage), and
+    the number of images Pillow allocated, since Pillow's pixel buffers don't go through Python's allocator.
+    Does nothing until it's enabled, so the pipeline can be instrumented unconditionally.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records: list[dict[str, Any]] = []
+        self._card: Optional[str] = None
+        self._current: Optional[dict[str, Any]] = None
+
+    def enable(self, trace_memory: bool = True):
+        import tracemalloc
+
+        self.enabled = True
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def card(self, name: str):
+        """
+        Attributes every stage recorded inside this block to the named card
+        """
+        parent, self._card = self._card, name
+        try:
+            yield
+        finally:
+            self._card = parent
+
+    @contextmanager
+    def stage(self, name: str, card: Optional[str] = None, **extra):
+        if not self.enabled:
+            yield
+            return
+        import tracemalloc
+        from PIL import Image
+
+        record = {"stage": name, "card": card or self._card, **extra}
+        parent, self._current = self._current, record
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_images = Image.core.get_stats()["new_count"]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["images_allocated"] = Image.core.get_stats()["new_count"] - start_images
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                record["python_bytes"] = current - start_memory
+                record["python_peak_bytes"] = peak - start_memory
+            self._current = parent
+            self.records.append(record)
+
+    def record(self, name: str, seconds: float, card: Optional[str] = None, **extra):
+        """
+        Adds a stage that was timed somewhere stage() can't be used, like on another thread
+        """
+        if self.enabled:
+            self.records.append({"stage": name, "card": card or self._card, "seconds": seconds, "images_allocated": 0,
+                                 **extra})
+
+    def note(self, **extra):
+        """
+        Adds extra details, like the number of font fitting iterations, to the stage that's currently running
+        """
+        if self.enabled and self._current is not None:
+            self._current.update(extra)
+
+    def pop_records(self) -> list[dict[str, Any]]:
+        records, self.records = self.records, []
+        return records
+
+    def summary(self, slowest: int = 10) -> str:
+        """
+        A table of total and average time and allocations per stage, followed by the slowest cards
+        """
+        by_stage = defaultdict(list)
+        by_card = defaultdict(float)
+        for record in self.records:
+            by_stage[record["stage"]].append(record)
+            if record["card"] is not None:
+                by_card[record["card"]] += record["seconds"]
+        lines = [f"{'Stage':<24}{'Calls':>7}{'Total s':>10}{'Avg ms':>10}{'Images':>8}{'Py peak KB':>12}"
+                 f"{'Fit iters':>11}"]
+        for stage, records in sorted(by_stage.items(), key=lambda item: -sum(r["seconds"] for r in item[1])):
+            total = sum(r["seconds"] for r in records)
+            images = sum(r["images_allocated"] for r in records)
+            peak = max(r.get("python_peak_bytes", 0) for r in records) / 1024
+            iterations = sum(r.get("fit_iterations", 0) for r in records)
+            lines.append(f"{stage:<24}{len(records):>7}{total:>10.3f}{total / len(records) * 1000:>10.2f}{images:>8}"
+                         f"{peak:>12.1f}{iterations or '':>11}")
+        if by_card:
+            lines.append("")
+            lines.append(f"Slowest cards:")
+            for card, seconds in sorted(by_card.items(), key=lambda item: -item[1])[:slowest]:
+                lines.append(f"{seconds * 1000:>10.2f} ms  {card}")
+        return "\n".join(lines)
+
+    def write_json(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump(self.records, f, indent=2)
+
+
+profiler = StageProfiler()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from typing import Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+
+from card_cache import CardCache
+
+CACHE_FOLDER = "cache/qr"
+
+
+class QrCodeCache:
+    """
+    Keeps rendered QR codes, which only depend on their URL and QR settings, so each one is only generated once.
+    The most recently used max_entries codes are kept in memory. If a folder is given, codes are also stored there, so
+    later runs and worker processes can skip generating them entirely.
+    A scale below 1 makes codes for proofs, by shrinking the print-size code, so they keep the print's proportions
+    rather than rounding box_size to a whole number of pixels.
+    """
+
+    def __init__(self, max_entries: int = 4096, folder: str = CACHE_FOLDER, version: int = 1, box_size: int = 5,
+                 border: int = 2, scale: float = 1):
+        self.max_entries = max_entries
+        self.disk = CardCache(folder) if folder else None
+        self.version, self.box_size, self.border, self.scale = version, box_size, border, scale
+        self._images: OrderedDict[str, Image] = OrderedDict()
+        self.hits, self.misses, self.generated = 0, 0, 0
+
+    def get(self, url: str) -> Image:
+        """
+        Returns the QR code for url. The returned image is shared, so don't modify it.
+        """
+        qr_img = self._images.get(url)
+        if qr_img is not None:
+            self._images.move_to_end(url)
+            self.hits += 1
+            return qr_img
+        self.misses += 1
+        disk_key = self._disk_key(url)
+        qr_img = self.disk.get(disk_key) if self.disk is not None else None
+        if qr_img is None:
+            qr_img = self._make(url)
+            self.generated += 1
+            if self.disk is not None:
+                self.disk.put(disk_key, qr_img)
+        self._images[url] = qr_img
+        if len(self._images) > self.max_entries:
+            self._images.popitem(last=False)
+        return qr_img
+
+    def pregenerate(self, urls: Iterable[str]) -> int:
+        """
+        Builds the QR codes for all of the urls up front, so they're ready before any cards get composited.
+
+        @return int: The number of QR codes that weren't already cached, in memory or on disk.
+        """
+        generated = self.generated
+        for url in dict.fromkeys(urls):
+            self.get(url)
+        return self.generated - generated
+
+    def _make(self, url: str) -> Image:
+        # qrcode is slow to import, and most runs get every code from the cache
+        import qrcode
+
+        qr = qrcode.QRCode(
+            version=self.version,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=self.box_size,
+            border=self.border,
+        )
+        qr.add_data(url)
+        qr.make(fit=True)
+        qr_img = qr.make_image().get_image()
+        if self.scale != 1:
+            from PIL import Image
+
+            qr_img = qr_img.resize((round(qr_img.width * self.scale), round(qr_img.height * self.scale)),
+                                   Image.Resampling.NEAREST)
+        return qr_img
+
+    def _disk_key(self, url: str) -> str:
+        settings = f"{self.version}:L:{self.box_size}:{self.border}"
+        if self.scale != 1:
+            # Print-size codes keep the keys they had before proofs were added
+            settings += f":{self.scale}"
+        return hashlib.sha256(f"{settings}\n{url}".encode()).hexdigest()
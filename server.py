@@ -0,0 +1,156 @@
+"""
+A local HTTP server that renders single card previews, keeping layouts, fonts, fitted artwork and QR codes warm in
+memory between requests.
+
+    GET  /card?path=items/magic_items/common/mystery_key.toml   Renders an item TOML from disk
+    POST /card?format=webp                                       Renders the TOML in the request body
+
+format is png (the default) or webp, and quality sets the WebP quality (default 90). A posted TOML can also pass path,
+which is only used to pick its layout by rarity folder.
+
+Encoding takes longer than rendering, so each worker also keeps its most recently encoded previews, keyed by card key,
+and a card whose inputs haven't changed is served straight from there.
+"""
+import os
+import tomllib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO, StringIO
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import main
+
+FORMATS = {"png": "image/png", "webp": "image/webp"}
+# Previews are thrown away after they're looked at, so favour encoding speed over size
+PNG_COMPRESS_LEVEL = 1
+WEBP_METHOD = 0
+MAX_BODY_BYTES = 1024 * 1024
+MAX_PREVIEWS = 256
+
+_previews: OrderedDict[tuple, bytes] = OrderedDict()
+
+
+def init_worker():
+    main.get_layouts()
+
+
+def render_preview(toml_path: str, toml_text: Optional[str], image_format: str = "png", quality: int = 90) -> bytes:
+    """
+    Worker process entry point. Renders one card, from toml_text if it's given or else from the file at toml_path, and
+    returns it encoded in image_format.
+    """
+    toml_dict = tomllib.loads(toml_text) if toml_text is not None else main.open_toml(toml_path)
+    key = (main.get_card_key(toml_dict, main.get_layout(toml_path, toml_dict)), image_format, quality)
+    data = _previews.get(key)
+    if data is not None:
+        _previews.move_to_end(key)
+        return data
+    with redirect_stdout(StringIO()):
+        im = main.build_card(toml_path, toml_dict)[0]
+    buffer = BytesIO()
+    if image_format == "webp":
+        im.save(buffer, format="WEBP", quality=quality, method=WEBP_METHOD)
+    else:
+        im.save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    data = _previews[key] = buffer.getvalue()
+    if len(_previews) > MAX_PREVIEWS:
+        _previews.popitem(last=False)
+    return data
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    Handles each request on its own thread, and renders on a pool of worker processes, each of which keeps its own
+    caches warm
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], executor: ProcessPoolExecutor):
+        super().__init__(address, PreviewRequestHandler)
+        self.executor = executor
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    server: PreviewServer
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self.send_body(HTTPStatus.OK, b"ok", "text/plain")
+            return
+        if url.path != "/card":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        query = parse_qs(url.query)
+        if "path" not in query:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Missing path")
+            return
+        self.render(query, None)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/card":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return
+        try:
+            toml_text = self.rfile.read(length).decode()
+        except UnicodeDecodeError:
+            self.send_error(HTTPStatus.BAD_REQUEST, "The TOML isn't valid UTF-8")
+            return
+        self.render(parse_qs(url.query), toml_text)
+
+    def render(self, query: dict[str, list[str]], toml_text: Optional[str]):
+        toml_path = query.get("path", [""])[0]
+        image_format = query.get("format", ["png"])[0]
+        if image_format not in FORMATS:
+            self.send_error(HTTPStatus.BAD_REQUEST, f"Invalid format: {image_format}")
+            return
+        if os.path.isabs(toml_path) or ".." in os.path.normpath(toml_path).split(os.sep):
+            self.send_error(HTTPStatus.BAD_REQUEST, "path has to be inside the project")
+            return
+        try:
+            quality = int(query.get("quality", ["90"])[0])
+            data = self.server.executor.submit(render_preview, toml_path, toml_text, image_format, quality).result()
+        except FileNotFoundError as e:
+            self.send_error(HTTPStatus.NOT_FOUND, str(e))
+        except (tomllib.TOMLDecodeError, KeyError, ValueError) as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, f"Can't render the card: {e!r}")
+        except Exception as e:
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, repr(e))
+        else:
+            self.send_body(HTTPStatus.OK, data, FORMATS[image_format])
+
+    def send_body(self, status: HTTPStatus, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 0):
+    """
+    Runs the preview server until it's interrupted. workers <= 0 uses every core.
+    """
+    workers = workers if workers > 0 else os.cpu_count()
+    # Compile the layouts up front, so forked workers start out with them
+    main.get_layouts()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        # Start every worker now, rather than making the first requests wait for them
+        for future in [executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        with PreviewServer((host, port), executor) as server:
+            print(f"Serving card previews on http://{host}:{port}/card with {workers} workers. Press Ctrl+C to stop.")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
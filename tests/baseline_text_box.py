@@ -0,0 +1,170 @@
+"""
+TextBox as it was before text rendering was optimized: a linear wrap that measures the whole line for every word, a
+shrink-to-fit that steps down one point at a time, and a 5000x5000 scratch layer for every text box drawn. The
+optimized TextBox in pil_helpers has to match it exactly, so the tests compare the two.
+Fonts come from pil_helpers.build_font, which only caches them and doesn't change how anything is measured or drawn.
+"""
+from functools import lru_cache
+from typing import Tuple, Union, List
+
+from PIL import ImageFont, ImageDraw, Image, ImageOps
+
+from enums import HAlign, VAlign
+from pil_helpers import DEFAULT_FONT, build_font, get_anchors
+
+
+class TextBox:
+
+    def __init__(self, x, y, w, h, halign: HAlign = HAlign.CENTER, valign: VAlign = VAlign.CENTER,
+                 font_name: str = DEFAULT_FONT, font_size: int = 32, rotate: int = 0,
+                 use_height_for_text_wrap: bool = False, shrink_font_size_to_fit: bool = False):
+        self.x, self.y, self.width, self.height = x, y, w, h
+        self.halign, self.valign, self.rotate = halign, valign, rotate
+        self.use_height_for_text_wrap = use_height_for_text_wrap
+        self.shrink_font_to_fit = shrink_font_size_to_fit
+        self.font_name, self.font_size = font_name, font_size
+
+    @staticmethod
+    def wrap_text(text, font, max_width=0):
+        text = text.strip("\n")
+        if max_width <= 0:
+            return text
+
+        temp = ""
+        wrapped_text = ""
+
+        for w in text.split(' '):
+            if "\n" in w:
+                wrapped_text += temp.strip(' ')
+                width = font.getlength("{} {}".format(temp, w.partition('\n')[0]))
+                if width > max_width:
+                    wrapped_text += "\n"
+                else:
+                    wrapped_text += " "
+                par = w.rpartition('\n')
+                wrapped_text += par[0] + "\n"
+                temp = par[2] + " "
+            else:
+                width = font.getlength(u"{0} {1}".format(temp, w))
+                if width > max_width:
+                    wrapped_text += temp.strip(' ') + "\n"
+                    temp = ""
+                temp += w + " "
+        return wrapped_text + temp.strip(' ')
+
+    def get_text_block_size(self, text: str, font: ImageFont, leading_offset: int = 0) -> Tuple[List[str], int, int]:
+        wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
+        lines = wrapped_text.split('\n')
+        leading = font.font.ascent + font.font.descent + leading_offset
+        max_line_width = 0
+        for line in lines:
+            left, top, right, bottom = font.getbbox(line)
+            max_line_width = max(max_line_width, right - left)
+        return lines, max_line_width, len(lines) * leading
+
+    def shrink_font_until_text_fits(self, text: str, font_name: str, starting_font_size: int, width: int, height: int
+                                    ) -> Tuple[List[str], ImageFont]:
+        font_size = starting_font_size
+        while font_size > 0:
+            font = build_font(font_name, font_size)
+            text_lines, block_width, block_height = self.get_text_block_size(text, font)
+            if block_width <= width and block_height <= height:
+                return text_lines, font
+            font_size -= 1
+        else:
+            raise ValueError("Text is too big to fit in the text box at any font size")
+
+    def add_text(self, image: Image, text: str, color: Union[str, Tuple[int, int, int]] = "black",
+                 leading_offset: int = 0):
+        if self.shrink_font_to_fit:
+            text_lines, font = self.shrink_font_until_text_fits(
+                text, self.font_name, self.font_size, self.width, self.height
+            )
+        else:
+            font = build_font(self.font_name, self.font_size)
+            wrapped_text = self.wrap_text(text, font, self.height if self.use_height_for_text_wrap else self.width)
+            text_lines = wrapped_text.split('\n')
+
+        layer, total_text_size = draw_text_block(tuple(text_lines), font, self.halign, leading_offset)
+        if self.rotate != 0:
+            layer = layer.rotate(self.rotate, expand=True)
+
+        anchor_x, anchor_y = get_anchors(self.x, self.y, self.width, self.height, self.halign, self.valign)
+
+        layer_width, layer_height = layer.size
+        if self.halign == HAlign.LEFT:
+            coords_x = anchor_x
+        elif self.halign == HAlign.CENTER:
+            coords_x = anchor_x - layer_width // 2
+        elif self.halign == HAlign.RIGHT:
+            coords_x = anchor_x - layer_width
+        else:
+            raise ValueError(f"Invalid halign value: {self.halign}")
+        if self.valign == VAlign.TOP:
+            coords_y = anchor_y
+        elif self.valign == VAlign.CENTER:
+            coords_y = anchor_y - layer_height // 2
+        elif self.valign == VAlign.BOTTOM:
+            coords_y = anchor_y - layer_height
+        else:
+            raise ValueError(f"Invalid valign value: {self.valign}")
+
+        image.paste(ImageOps.colorize(layer, (255, 255, 255), color), (coords_x, coords_y), layer)
+        return total_text_size
+
+
+@lru_cache(maxsize=None)
+def draw_text_block(text_lines: Tuple[str, ...], font: ImageFont, halign: HAlign, leading_offset: int
+                    ) -> Tuple[Image, Tuple[float, int]]:
+    """
+    Draws the lines on a 5000x5000 layer and crops it down to the text block. Alignment along the other axis and
+    rotation only move and turn the cropped layer, so it's cached, to keep the tests comparing every combination quick.
+    """
+    layer = Image.new('L', (5000, 5000))
+    draw = ImageDraw.Draw(layer)
+    start_y = 500
+    if halign == HAlign.LEFT:
+        start_x = 500
+    elif halign == HAlign.CENTER:
+        start_x = 2500
+    elif halign == HAlign.RIGHT:
+        start_x = 4500
+    else:
+        raise ValueError(f"Invalid halign value: {halign}")
+
+    leading = font.font.ascent + font.font.descent + leading_offset
+
+    y = start_y
+    max_line_width = 0
+    for line in text_lines:
+        if not line == "":
+            line_width = font.getlength(line)
+            if halign == HAlign.LEFT:
+                x_pos = start_x
+            elif halign == HAlign.CENTER:
+                x_pos = start_x - (line_width / 2)
+            elif halign == HAlign.RIGHT:
+                x_pos = start_x - line_width
+            else:
+                raise ValueError(f"Invalid halign value: {halign}")
+            max_line_width = max(max_line_width, line_width)
+            draw.text((x_pos, y), line, font=font, fill=255)
+        y += leading
+
+    total_text_size = (max_line_width, len(text_lines) * leading)
+
+    top = start_y
+    bottom = y - leading_offset
+    if halign == HAlign.LEFT:
+        left = start_x
+        right = start_x + max_line_width
+    elif halign == HAlign.CENTER:
+        left = start_x - max_line_width / 2
+        right = start_x + max_line_width / 2
+    elif halign == HAlign.RIGHT:
+        left = start_x - max_line_width
+        right = start_x
+    else:
+        raise ValueError(f"Invalid halign value: {halign}")
+    layer = layer.crop((left, top, right, bottom))
+    return layer, total_text_size
@@ -0,0 +1,31 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules live at the root of the repo, and items, fonts and layouts are found relative to it
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# The items copied into the catalog fixture
+DECK = os.path.join(ROOT, "items", "magic_items", "common")
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """
+    A catalog of a copy of one rarity folder, with a TOML that doesn't parse next to its items
+    """
+    from catalog import Catalog
+
+    items_folder = str(tmp_path / "items")
+    shutil.copytree(DECK, os.path.join(items_folder, "common"))
+    os.makedirs(os.path.join(items_folder, "treasure"))
+    with open(os.path.join(items_folder, "treasure", "broken.toml"), "w") as f:
+        f.write('name = "Broken\n')
+    catalog = Catalog(path=str(tmp_path / "catalog.sqlite"), items_folder=items_folder)
+    yield catalog
+    catalog.close()
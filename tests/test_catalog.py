@@ -0,0 +1,51 @@
+import os
+import tomllib
+
+import pytest
+
+import main
+from catalog import Catalog
+from conftest import DECK
+
+
+def test_broken_toml_is_skipped_and_only_fails_itself(catalog: Catalog, capsys):
+    broken = os.path.join(catalog.items_folder, "treasure", "broken.toml")
+    catalog.refresh()
+    assert f"Skipping {broken}" in capsys.readouterr().out
+    items = catalog.query()
+    assert len(items) == len([name for name in os.listdir(DECK) if name.endswith(".toml")])
+    assert all(item.rarity_folder == "common" for item in items)
+    assert catalog.get_toml(items[0].path)["name"] == items[0].name
+    assert list(catalog.get_errors()) == [broken]
+    with pytest.raises(tomllib.TOMLDecodeError):
+        catalog.get_toml(broken)
+
+    # Still skipped, and still warned about, until it's fixed
+    assert catalog.refresh() == (0, 0)
+    assert f"Skipping {broken}" in capsys.readouterr().out
+    with open(broken, "w") as f:
+        f.write('name = "Fixed"\n')
+    catalog.refresh()
+    assert catalog.get_errors() == {}
+    assert catalog.get_toml(broken)["name"] == "Fixed"
+    assert [item.path for item in catalog.query(rarity="treasure")] == [broken]
+
+
+def test_undecodable_toml_is_skipped(catalog: Catalog):
+    with open(os.path.join(catalog.items_folder, "treasure", "latin1.toml"), "wb") as f:
+        f.write('name = "Café"\n'.encode("latin-1"))
+    catalog.refresh()
+    assert len(catalog.get_errors()) == 2
+    with pytest.raises(UnicodeDecodeError):
+        catalog.get_toml(os.path.join(catalog.items_folder, "treasure", "latin1.toml"))
+
+
+def test_catalog_is_only_kept_once_refreshed(monkeypatch):
+    def fail(self):
+        raise OSError("items folder went away")
+
+    monkeypatch.setattr(main, "_catalog", None)
+    monkeypatch.setattr(Catalog, "refresh", fail)
+    with pytest.raises(OSError):
+        main.get_catalog()
+    assert main._catalog is None
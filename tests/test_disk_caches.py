@@ -0,0 +1,14 @@
+import main
+
+
+def test_no_cache_turns_off_the_artwork_and_qr_disk_caches():
+    main.get_layouts()
+    try:
+        main.main(["--no-cache", "cache", "stats"])
+        assert main.get_artwork().disk is None
+        assert all(layout.qr_codes.disk is None for layout in main.get_layouts().values())
+        assert all(layout.qr_codes.disk is None for layout in main.get_layouts(scale=0.5).values())
+    finally:
+        main.set_disk_caches(True)
+    assert main.get_artwork().disk is not None
+    assert all(layout.qr_codes.disk is not None for layout in main.get_layouts().values())
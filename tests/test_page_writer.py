@@ -0,0 +1,26 @@
+import os
+
+from PIL import Image
+
+from page_writer import PageWriter
+
+
+def test_pages_with_the_same_key_are_copied(tmp_path):
+    pages = [Image.new("RGB", (30, 40), color) for color in ("red", "blue", "red")]
+    filenames = [str(tmp_path / f"{i}.png") for i in range(3)]
+    with PageWriter(image_format="png", max_pending=1) as writer:
+        for page, filename, key in zip(pages, filenames, [("a",), ("b",), ("a",)]):
+            writer.add_page(page, filename, key=key)
+    assert writer.page_count == 3 and writer.reused == 1
+    with open(filenames[0], "rb") as first, open(filenames[2], "rb") as third:
+        assert first.read() == third.read()
+
+
+def test_pending_pages_are_bounded_whatever_the_thread_count(tmp_path):
+    writer = PageWriter(threads=os.cpu_count() * 4, max_pending=2)
+    with writer:
+        for i in range(6):
+            writer.add_page(Image.new("RGB", (30, 40)), str(tmp_path / f"{i}.png"))
+            assert len(writer._pending) <= 2
+    assert writer.threads <= 2
+    assert sorted(os.listdir(tmp_path)) == [f"{i}.png" for i in range(6)]
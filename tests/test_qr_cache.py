@@ -0,0 +1,18 @@
+import pytest
+
+import main
+from qr_cache import QrCodeCache
+
+URL = "https://www.dndbeyond.com/magic-items/4585-potion-of-healing"
+
+
+@pytest.mark.parametrize("scale", [0.5, 0.25])
+def test_proof_qr_codes_keep_the_print_proportions(scale: float):
+    # Rounding box_size 5 at half scale gave 2 pixel modules, a fifth smaller than the rest of the proof
+    print_img = QrCodeCache(folder=None).get(URL)
+    proof_img = QrCodeCache(folder=None, scale=scale).get(URL)
+    assert proof_img.size == (round(print_img.width * scale), round(print_img.height * scale))
+
+    print_layout, proof_layout = main.get_layouts()["default"], main.get_layouts(scale=scale)["default"]
+    assert proof_layout.qr_codes.get(URL).width / print_layout.qr_codes.get(URL).width == \
+           pytest.approx(proof_layout.size[0] / print_layout.size[0], abs=0.01)
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+# Wall time for a whole `python main.py catalog` or `cache` run, interpreter startup included. They take about 70 ms.
+STARTUP_BUDGET_SECONDS = 0.3
+# Modules that only rendering needs, which commands that don't render shouldn't pay for importing. artwork_cache and
+# qr_cache aren't here, since the cache command needs their folders, and they only import Pillow and qrcode when used.
+RENDERING_MODULES = ("PIL", "qrcode", "pil_helpers", "layouts", "validate", "server", "watch")
+
+
+def run(args: list[str], env: dict = None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def get_imported_modules(args: list[str]) -> set[str]:
+    # -X importtime reports every module imported, as "import time: <self> | <cumulative> | <indented name>"
+    lines = run(["-X", "importtime", "main.py", *args]).stderr.splitlines()
+    return {line.rsplit("|", 1)[1].strip() for line in lines if line.startswith("import time:") and "|" in line}
+
+
+@pytest.mark.parametrize("command", [["catalog"], ["cache"]])
+def test_commands_that_dont_render_skip_rendering_imports(command: list[str]):
+    imported = get_imported_modules(command)
+    # main.py runs as __main__, so check for one of its own imports to be sure the report was read
+    assert "card_cache" in imported
+    heavy = sorted(name for name in imported if name.split(".")[0] in RENDERING_MODULES)
+    assert heavy == []
+
+
+@pytest.mark.parametrize("command", [["catalog"], ["cache"]])
+def test_commands_that_dont_render_start_quickly(command: list[str]):
+    # The first run can include compiling bytecode and indexing the catalog, so time the best of the next few
+    run(["main.py", *command])
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        run(["main.py", *command])
+        times.append(time.perf_counter() - start)
+    assert min(times) < STARTUP_BUDGET_SECONDS
+
+
+def test_pil_helpers_imports_without_fonts_folder():
+    env = {key: value for key, value in os.environ.items() if key != "FONTS_FOLDER"}
+    result = run(["-c", "import pil_helpers; print(pil_helpers.get_fonts_folder()); "
+                        "print(pil_helpers.build_font(pil_helpers.DEFAULT_FONT, 32).size)"], env=env)
+    assert result.stdout.split() == ["None", "32"]
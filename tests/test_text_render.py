@@ -0,0 +1,193 @@
+import glob
+import itertools
+import tomllib
+from functools import lru_cache
+
+import pytest
+from PIL import Image, ImageChops, ImageFont, features
+
+import baseline_text_box
+import main
+import pil_helpers
+from enums import HAlign, VAlign
+
+# 180 and 270 turn the layer with the same lossless transpose as 90, and 13 goes through resampling
+ROTATIONS = (0, 90, 13)
+# Not white, so text colorized onto white and pasted badly would still show up
+BACKGROUND = (200, 180, 160)
+
+
+def get_layout_settings() -> dict:
+    with open("layouts/default.toml", "rb") as f:
+        return tomllib.load(f)
+
+
+def get_card_texts() -> list[tuple[str, str]]:
+    """
+    The text of every card in items/, as (box, text) pairs
+    """
+    texts = []
+    for toml_path in sorted(glob.glob("items/**/*.toml", recursive=True)):
+        toml_dict = main.open_toml(toml_path)
+        if toml_dict.get("image_is_card"):
+            continue
+        texts += [("name", toml_dict["name"]), ("subtitle", main.get_subtitle(toml_dict)),
+                  ("description", toml_dict["description"])]
+    return texts
+
+
+def build_text_boxes(settings: dict, **overrides) -> tuple[pil_helpers.TextBox, baseline_text_box.TextBox]:
+    """
+    The same box, from the layout settings, as an optimized TextBox and a baseline one
+    """
+    kwargs = {
+        "halign": HAlign[settings.get("halign", "center").upper()],
+        "valign": VAlign[settings.get("valign", "center").upper()],
+        "font_name": settings.get("font", pil_helpers.DEFAULT_FONT),
+        "font_size": settings.get("font_size", 32),
+        "shrink_font_size_to_fit": settings.get("shrink_to_fit", False),
+    }
+    kwargs.update(overrides)
+    return pil_helpers.TextBox(*settings["box"], **kwargs), baseline_text_box.TextBox(*settings["box"], **kwargs)
+
+
+@lru_cache(maxsize=None)
+def get_baseline_font_size(box: str, text: str) -> int:
+    """
+    The font size the baseline shrinks the text to in the default layout's box. It doesn't depend on alignment or
+    rotation, so it's worked out once per text rather than once per combination.
+    """
+    old_box = build_text_boxes(get_layout_settings()[box])[1]
+    if not old_box.shrink_font_to_fit:
+        return old_box.font_size
+    return old_box.shrink_font_until_text_fits(text, old_box.font_name, old_box.font_size, old_box.width,
+                                               old_box.height)[1].size
+
+
+def assert_same_render(new_box: pil_helpers.TextBox, old_box: baseline_text_box.TextBox, text: str, **kwargs):
+    new_im, old_im = Image.new("RGB", (745, 1040), BACKGROUND), Image.new("RGB", (745, 1040), BACKGROUND)
+    assert new_box.add_text(new_im, text, **kwargs) == old_box.add_text(old_im, text, **kwargs)
+    assert ImageChops.difference(new_im, old_im).getbbox() is None, f"{text[:40]!r} renders differently"
+
+
+@pytest.mark.parametrize("box", ["name", "subtitle", "description"])
+def test_layout_matches_baseline(box: str):
+    settings = get_layout_settings()[box]
+    new_box, old_box = build_text_boxes(settings)
+    for name, text in get_card_texts():
+        if name != box:
+            continue
+        lines, font = new_box.layout(text)
+        assert font.size == get_baseline_font_size(box, text)
+        old_font = pil_helpers.build_font(old_box.font_name, font.size)
+        assert lines == old_box.wrap_text(text, old_font, old_box.width).split("\n")
+
+
+@pytest.mark.parametrize("halign,valign,rotate", list(itertools.product(HAlign, VAlign, ROTATIONS)))
+def test_add_text_matches_baseline(halign: HAlign, valign: VAlign, rotate: int):
+    """
+    Every card's text, drawn by the bounded renderer and by the baseline's 5000x5000 layer. The optimized box still
+    fits its text itself, and the baseline box is handed the size its own shrink-to-fit picked, which
+    test_layout_matches_baseline checks is the same.
+    """
+    pil_helpers.text_layers.clear()
+    settings = get_layout_settings()
+    for name, text in get_card_texts():
+        new_box = build_text_boxes(settings[name], halign=halign, valign=valign, rotate=rotate)[0]
+        old_box = build_text_boxes(settings[name], halign=halign, valign=valign, rotate=rotate,
+                                   font_size=get_baseline_font_size(name, text), shrink_font_size_to_fit=False)[1]
+        assert_same_render(new_box, old_box, text)
+
+
+@pytest.mark.parametrize("color,leading_offset", [("black", 3), ((120, 10, 30), 0), ("#3355aa", -2)])
+def test_add_text_color_and_leading_match_baseline(color, leading_offset: int):
+    pil_helpers.text_layers.clear()
+    new_box, old_box = build_text_boxes(get_layout_settings()["description"])
+    for name, text in get_card_texts():
+        if name == "description":
+            assert_same_render(new_box, old_box, text, color=color, leading_offset=leading_offset)
+
+
+@pytest.mark.parametrize("text", ["", "a", "W" * 40, "\n\nfoo\n\nbar  baz\n"])
+def test_add_text_edge_cases_match_baseline(text: str):
+    pil_helpers.text_layers.clear()
+    for halign, valign in itertools.product(HAlign, VAlign):
+        assert_same_render(*build_text_boxes({"box": [40, 300, 670, 400]}, halign=halign, valign=valign), text)
+
+
+def test_shrink_to_fit_picks_the_largest_size_that_fits():
+    # 9pt wraps onto one more line than 10pt and 11pt and overflows, so a bisection that tries 9pt never finds 11pt
+    text = main.open_toml("items/magic_items/uncommon/spellwrought_tattoo_see_invisibility.toml")["description"]
+    new_box, old_box = build_text_boxes({"box": [0, 0, 200, 60], "font": "fonts/Enchanted Land DEMO.otf",
+                                         "font_size": 50, "shrink_to_fit": True})
+    assert new_box.layout(text)[1].size == 11
+    assert old_box.shrink_font_until_text_fits(text, old_box.font_name, 50, 200, 60)[1].size == 11
+
+
+def test_shrink_to_fit_matches_baseline_in_a_small_box():
+    # Most text has to shrink a long way to fit a box this small, so it steps through many sizes
+    new_box, old_box = build_text_boxes({"box": [0, 0, 200, 60], "font": "fonts/Enchanted Land DEMO.otf",
+                                         "font_size": 50, "shrink_to_fit": True})
+    for _, text in get_card_texts():
+        lines, font = old_box.shrink_font_until_text_fits(text, old_box.font_name, 50, 200, 60)
+        assert new_box.layout(text) == (lines, font)
+
+
+@pytest.mark.parametrize("text,max_width,expected", [
+    # A word containing a newline ends the line, and what follows its last newline starts the next one
+    ("one two\nthree\nfour five", 200, "one two\nthree\nfour five"),
+    # Leading and trailing newlines are stripped, and blank lines in between are kept
+    ("\n\nfoo\n\nbar\n", 200, " foo\n\nbar"),
+    # A newline word that's the very first word starts its line with a space
+    ("foo\nbar baz", 200, " foo\nbar baz"),
+    # ...or leaves a blank line, if the part before its newline is too wide
+    ("WWWWWWWWWW\nbar", 100, "\nWWWWWWWWWW\nbar"),
+    # The part of a newline word before its newline is pushed onto a line of its own if it doesn't fit
+    ("first WWWWWWWWWW\nbar", 150, "first\nWWWWWWWWWW\nbar"),
+    # A word too wide for an empty line leaves a blank line behind it
+    ("WWWWWWWWWW foo", 100, "\nWWWWWWWWWW\nfoo"),
+    ("foo WWWWWWWWWW bar", 100, "foo\nWWWWWWWWWW\nbar"),
+    # Runs of spaces are empty words, and stay in the line
+    ("a   b", 200, "a   b"),
+    ("a   b  ", 200, "a   b"),
+])
+def test_wrap_text_newline_semantics(text: str, max_width: int, expected: str):
+    font = pil_helpers.build_font(pil_helpers.DEFAULT_FONT, 32)
+    assert baseline_text_box.TextBox.wrap_text(text, font, max_width) == expected
+    assert pil_helpers.TextBox.wrap_text(text, font, max_width) == expected
+
+
+def test_wrap_text_checks_width_with_two_spaces():
+    # The next word fits if the line, two spaces and the word do, even though only one space ends up between them
+    font = pil_helpers.build_font(pil_helpers.DEFAULT_FONT, 32)
+    one_space, two_spaces = font.getlength("aaa aaa"), font.getlength("aaa  aaa")
+    assert one_space < two_spaces
+    for max_width, expected in [(two_spaces, "aaa aaa"), (two_spaces - 1, "aaa\naaa"), (one_space + 1, "aaa\naaa")]:
+        assert baseline_text_box.TextBox.wrap_text("aaa aaa", font, max_width) == expected
+        assert pil_helpers.TextBox.wrap_text("aaa aaa", font, max_width) == expected
+
+
+@pytest.mark.parametrize("layout_engine", [
+    ImageFont.Layout.BASIC,
+    pytest.param(ImageFont.Layout.RAQM, marks=pytest.mark.skipif(not features.check("raqm"),
+                                                                 reason="Pillow was built without raqm")),
+])
+@pytest.mark.parametrize("font_name", [pil_helpers.DEFAULT_FONT, "fonts/Enchanted Land DEMO.otf"])
+def test_wrap_text_matches_baseline(font_name: str, layout_engine: ImageFont.Layout):
+    texts = [text for _, text in get_card_texts()]
+    texts += ["", "  ", "\n", "a\n\n  b", "AV To  W\n f é — \n\n.", " leading and trailing spaces "]
+    for font_size in (8, 19, 32, 50):
+        font = ImageFont.truetype(font_name, font_size, layout_engine=layout_engine)
+        for text in texts:
+            for max_width in (0, 15, 60, 200, 650):
+                assert pil_helpers.TextBox.wrap_text(text, font, max_width) == \
+                       baseline_text_box.TextBox.wrap_text(text, font, max_width), (text[:40], font_size, max_width)
+
+
+def test_wrap_text_by_measuring_lines_matches_baseline():
+    # The fallback for Raqm fonts, run with the basic engine here, so it's tested even without raqm
+    font = pil_helpers.build_font(pil_helpers.DEFAULT_FONT, 32)
+    for _, text in get_card_texts():
+        for max_width in (60, 200, 650):
+            assert pil_helpers.wrap_text_by_measuring_lines(text.strip("\n"), font, max_width) == \
+                   baseline_text_box.TextBox.wrap_text(text, font, max_width)
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import main
+import validate
+
+CARD = {"name": "Test Potion", "type": "potion, common", "description": "Tastes of cinnamon.",
+        "image_path": "potion_of_barkskin.png"}
+
+
+@pytest.mark.parametrize("missing", ["name", "type", "description", "image_path"])
+def test_cards_that_fail_to_render_fail_validation(missing: str):
+    toml_dict = {key: value for key, value in CARD.items() if key != missing}
+    report = validate.validate_card("items/magic_items/common/test_potion.toml", toml_dict)
+    assert report.errors == [f"missing {missing}"]
+    with pytest.raises(KeyError):
+        main.build_card("items/magic_items/common/test_potion.toml", toml_dict)
+
+
+def test_complete_card_validates_and_renders():
+    report = validate.validate_card("items/magic_items/common/test_potion.toml", CARD)
+    assert report.errors == []
+    im = main.build_card("items/magic_items/common/test_potion.toml", CARD)[0]
+    assert im.size == main.get_layouts()["default"].size
+
+
+def test_validate_all_reports_unparseable_items_as_card_errors(catalog, monkeypatch, capsys):
+    catalog.refresh()
+    monkeypatch.setattr(main, "_catalog", catalog)
+    assert main.main(["validate", "--all"]) == 1
+    out = capsys.readouterr().out
+    assert f"{catalog.items_folder}/treasure/broken.toml" in out and "ERROR: can't load: " in out
+    assert f"Checked {len(catalog.query()) + 1} cards" in out
+
+
+def test_validate_without_card_list_checks_every_item(catalog, monkeypatch, tmp_path):
+    catalog.refresh()
+    monkeypatch.setattr(main, "_catalog", catalog)
+    monkeypatch.chdir(tmp_path)
+    paths = main.get_paths_to_validate([], all_items=False)
+    assert paths == main.get_paths_to_validate([], all_items=True)
+    assert f"{catalog.items_folder}/treasure/broken.toml" in paths
+    assert main.main(["validate"]) == 1
+    assert not os.path.exists("card_list.csv")
+
+
+def test_validate_fails_when_the_cards_cant_be_listed(monkeypatch, capsys):
+    def fail():
+        raise OSError("items folder went away")
+
+    monkeypatch.setattr(main, "get_catalog", fail)
+    assert main.main(["validate", "--all"]) == 1
+    assert "Can't list the cards to check: items folder went away" in capsys.readouterr().out
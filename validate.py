@@ -0,0 +1,130 @@
+import os
+from typing import Any, NamedTuple, Optional
+
+from PIL import Image
+
+import main
+from pil_helpers import TextBox
+
+# Below this size, text is hard to read once printed
+MIN_FONT_SIZE = 20
+# Artwork outside of these bounds is probably a mistake: a thumbnail, a huge scan, or a strip of an image
+MIN_IMAGE_SIZE = 64
+MAX_IMAGE_SIZE = 10000
+MAX_ASPECT_RATIO = 8
+
+
+class BoxReport(NamedTuple):
+    box: str
+    font_size: int
+    line_count: int
+    width_fill: float
+    height_fill: float
+
+
+class CardReport(NamedTuple):
+    path: str
+    boxes: list[BoxReport]
+    errors: list[str]
+    warnings: list[str]
+
+
+def check_box(name: str, box: TextBox, text: str, min_font_size: int, errors: list[str], warnings: list[str]
+              ) -> Optional[BoxReport]:
+    """
+    Runs the same measuring and fitting add_text would, without drawing anything
+    """
+    try:
+        lines, font = box.layout(text)
+    except ValueError as e:
+        errors.append(f"{name}: {e}")
+        return None
+    _, block_width, block_height = box.get_text_block_size(text, font)
+    report = BoxReport(name, font.size, len(lines), block_width / box.width, block_height / box.height)
+    if font.size < min_font_size:
+        warnings.append(f"{name}: shrinks to {font.size}pt to fit")
+    # A single line is centered on its box, so it can be taller than the box and still look right, like the subtitle's
+    if report.width_fill > 1 or (report.height_fill > 1 and report.line_count > 1):
+        warnings.append(f"{name}: overflows its box ({report.width_fill:.0%} wide, {report.height_fill:.0%} tall)")
+    return report
+
+
+def check_image(image_path: str, errors: list[str], warnings: list[str]):
+    filepath = f"images/{image_path}"
+    if not os.path.isfile(filepath):
+        errors.append(f"image: {filepath} doesn't exist")
+        return
+    try:
+        # Opening only reads the header, so this doesn't decode any pixels
+        with Image.open(filepath) as im:
+            width, height = im.size
+    except OSError as e:
+        errors.append(f"image: can't read {filepath}: {e}")
+        return
+    if min(width, height) < MIN_IMAGE_SIZE or max(width, height) > MAX_IMAGE_SIZE:
+        warnings.append(f"image: {filepath} is {width}x{height}")
+    elif max(width, height) / min(width, height) > MAX_ASPECT_RATIO:
+        warnings.append(f"image: {filepath} has an extreme aspect ratio ({width}x{height})")
+
+
+def validate_card(toml_path: str, toml_dict: dict[str, Any], min_font_size: int = MIN_FONT_SIZE) -> CardReport:
+    boxes, errors, warnings = [], [], []
+    # Rendering reads every one of these, so a card missing any of them would fail to build
+    required = ["name", "image_path"]
+    if not toml_dict.get("image_is_card"):
+        required += ["type", "description"]
+    missing = [key for key in required if key not in toml_dict]
+    if missing:
+        errors.append(f"missing {', '.join(missing)}")
+        return CardReport(toml_path, boxes, errors, warnings)
+    if toml_dict.get("image_path"):
+        check_image(toml_dict["image_path"], errors, warnings)
+    if not toml_dict.get("image_is_card"):
+        try:
+            layout = main.get_layout(toml_path, toml_dict)
+        except ValueError as e:
+            errors.append(str(e))
+            return CardReport(toml_path, boxes, errors, warnings)
+        for name, text in (
+            ("name", toml_dict["name"]),
+            ("subtitle", main.get_subtitle(toml_dict)),
+            ("description", toml_dict["description"]),
+        ):
+            report = check_box(name, layout.boxes[name], text, min_font_size, errors, warnings)
+            if report is not None:
+                boxes.append(report)
+    return CardReport(toml_path, boxes, errors, warnings)
+
+
+def print_report(report: CardReport, verbose: bool = False):
+    if not verbose and not report.errors and not report.warnings:
+        return
+    print(report.path)
+    for box in report.boxes:
+        print(f"    {box.box:<12}{box.font_size:>4}pt{box.line_count:>4} lines"
+              f"{box.width_fill:>7.0%} wide{box.height_fill:>7.0%} tall")
+    for error in report.errors:
+        print(f"    ERROR: {error}")
+    for warning in report.warnings:
+        print(f"    WARNING: {warning}")
+
+
+def validate(toml_paths: list[str], min_font_size: int = MIN_FONT_SIZE, verbose: bool = False) -> int:
+    """
+    Checks every card's layout and artwork without rendering anything.
+
+    @return int: The number of cards with errors.
+    """
+    failed, warned = 0, 0
+    for toml_path in toml_paths:
+        try:
+            toml_dict = main.load_card_toml(toml_path)
+        except Exception as e:
+            report = CardReport(toml_path, [], [f"can't load: {e}"], [])
+        else:
+            report = validate_card(toml_path, toml_dict, min_font_size)
+        print_report(report, verbose)
+        failed += bool(report.errors)
+        warned += bool(report.warnings)
+    print(f"Checked {len(toml_paths)} cards: {failed} with errors, {warned} with warnings")
+    return failed
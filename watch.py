@@ -0,0 +1,125 @@
+import os
+import time
+from typing import Optional
+
+import main
+from card_cache import CardCache
+from pil_helpers import build_font, compose_page, get_kerning, get_text_length, text_layers
+
+WATCHED_PATHS = ("items", "images", "fonts", "layouts", "card_list.csv")
+# Pages are re-encoded on every save, so trade a bit of file size for a much faster PNG encode
+PAGE_COMPRESS_LEVEL = 1
+
+
+class DeckWatcher:
+    """
+    Keeps the cards in card_list.csv rendered in memory, and on each rebuild only re-renders the cards whose inputs
+    changed, then only re-saves the pages whose cards changed. Fonts, the template and fitted artwork stay warm in
+    memory between rebuilds.
+    """
+
+    def __init__(self, cache: Optional[CardCache] = None, grid: tuple[int, int] = (3, 3), folder: str = "pages"):
+        self.cache, self.grid, self.folder = cache, grid, folder
+        self.snapshot: dict[str, tuple[int, int]] = {}
+        self.toml_dicts: dict[str, dict] = {}
+        # Rendered cards by card key, and the card keys on each page as it was last saved
+        self.cards = {}
+        self.pages: list[tuple[str, ...]] = []
+
+    @staticmethod
+    def scan() -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        templates = [layout.template_path for layout in main.get_layouts().values()]
+        for path in (*WATCHED_PATHS, *templates):
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(filepath)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[filepath] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self) -> set[str]:
+        """
+        @return set[str]: Every watched path that was added, changed or removed since the last poll.
+        """
+        snapshot = self.scan()
+        changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path) != self.snapshot.get(path)}
+        self.snapshot = snapshot
+        return changed
+
+    def rebuild(self, changed: set[str]):
+        start = time.perf_counter()
+        if any(path.startswith("fonts") for path in changed):
+            # Loaded fonts and their measurements are cached by path, so they'd go stale
+            for cached in (build_font, get_text_length, get_kerning):
+                cached.cache_clear()
+            text_layers.clear()
+        if any(path.startswith("layouts") or path.startswith("fonts") for path in changed):
+            # Layouts preload their fonts, so they get compiled again after a font changes too
+            main.get_layouts(reload=True)
+        for path in changed:
+            self.toml_dicts.pop(os.path.normpath(path), None)
+        card_list_rows = main.get_card_list()
+        if card_list_rows is None:
+            return
+
+        deck, rendered = [], 0
+        for row in card_list_rows:
+            filepath = row["filepath"]
+            if os.path.normpath(filepath) not in self.toml_dicts:
+                self.toml_dicts[os.path.normpath(filepath)] = main.open_toml(filepath)
+            toml_dict = self.toml_dicts[os.path.normpath(filepath)]
+            key = main.get_card_key(toml_dict, main.get_layout(filepath, toml_dict))
+            if key not in self.cards:
+                self.cards[key] = main.build_card(filepath, toml_dict, cache=self.cache)[0]
+                rendered += 1
+            deck += [key] * row["count"]
+        # Let go of cards that aren't in the deck anymore
+        deck_keys = set(deck)
+        self.cards = {key: im for key, im in self.cards.items() if key in deck_keys}
+
+        os.makedirs(f"output/{self.folder}", exist_ok=True)
+        pages, saved = [tuple(page) for page in main.gen_chunks(deck, self.grid[0] * self.grid[1])], 0
+        for i, page in enumerate(pages):
+            filename = main.get_page_filename(self.folder, i)
+            if i < len(self.pages) and self.pages[i] == page and os.path.isfile(filename):
+                continue
+            print(f"Saving {filename}")
+            page_image = compose_page([self.cards[key] for key in page], self.grid, cut_line_width=0)
+            page_image.save(filename, dpi=(300, 300), compress_level=PAGE_COMPRESS_LEVEL)
+            saved += 1
+        for i in range(len(pages), len(self.pages)):
+            filename = main.get_page_filename(self.folder, i)
+            if os.path.isfile(filename):
+                print(f"Removing {filename}")
+                os.remove(filename)
+        self.pages = pages
+        print(f"Rendered {rendered} cards and saved {saved} pages in {time.perf_counter() - start:.2f}s")
+
+    def run(self, interval: float = 0.25):
+        print(f"Watching {', '.join(WATCHED_PATHS)} and the layouts' templates for changes. Press Ctrl+C to stop.")
+        changed = self.poll()
+        while True:
+            if changed:
+                try:
+                    self.rebuild(changed)
+                except Exception as e:
+                    # Keep watching, so the next save can fix whatever's wrong
+                    print(f"Build failed: {e!r}")
+            time.sleep(interval)
+            changed = self.poll()
+
+
+def watch(cache: Optional[CardCache] = None, interval: float = 0.25):
+    try:
+        DeckWatcher(cache).run(interval)
+    except KeyboardInterrupt:
+        pass